@@ -0,0 +1 @@
+# Benchmarks for the task manager, run as scripts rather than tests (see README.md in this folder).
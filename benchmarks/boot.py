@@ -0,0 +1,238 @@
+# Measures how long a new web worker takes before it can answer its first request.
+#
+#   python -m benchmarks.boot --database sqlite:////tmp/bench.db                # each step, in fresh processes
+#   python -m benchmarks.boot --database sqlite:////tmp/bench.db --gunicorn     # the real server, until it answers
+#
+# Every measurement starts a new Python process, since anything already imported or compiled would hide the cost.
+# That process goes through what wsgi.py does, one step at a time, and then sends one request through the test client:
+#   import     importing the taskmanager package (Flask, SQLAlchemy and the rest)
+#   create_app building the app, with commands=False like wsgi.py
+#   templates  loading every template, as templating.precompile() does
+#   first      the first request to the home page, which also opens the first database connection
+# once with the templates compiled from scratch ("cold", JINJA_BYTECODE_CACHE switched off), and once with
+# a bytecode cache that "flask precompile-templates" filled beforehand ("cached").
+# With --gunicorn, it starts "gunicorn wsgi:app" itself (with gunicorn.conf.py, and one worker),
+# and times how long the home page takes to answer, from the moment the command starts.
+# The results are saved as JSON in benchmarks/results/boot, and compared with the last saved run, like run.py does.
+import argparse
+import glob
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_FOLDER = os.path.join(os.path.dirname(__file__), "results", "boot")
+STEPS = ("import", "create_app", "templates", "first")
+
+
+def child():
+    # runs in the fresh process: only the standard library is imported before the clock starts
+    started = time.perf_counter()
+    times = {}
+    import taskmanager
+    times["import"] = time.perf_counter()
+    app = taskmanager.create_app(commands=False)
+    times["create_app"] = time.perf_counter()
+    from taskmanager import templating
+    templating.precompile(app)
+    times["templates"] = time.perf_counter()
+    response = app.test_client().get("/")
+    times["first"] = time.perf_counter()
+    if response.status_code != 200:
+        sys.exit("the home page answered {0}".format(response.status_code))
+    # each step in milliseconds, on its own rather than from the start
+    previous = started
+    steps = {}
+    for step in STEPS:
+        steps[step] = (times[step] - previous) * 1000
+        previous = times[step]
+    print(json.dumps(steps))
+
+
+def environment(database, cache_folder):
+    env = dict(os.environ)
+    if database:
+        env["DEVELOPMENT"] = "True"
+        env["DB_URL"] = database
+    env.setdefault("SECRET_KEY", "benchmark")
+    env["JINJA_BYTECODE_CACHE"] = cache_folder
+    env["PYTHONPATH"] = ROOT
+    # Python's own .pyc files are left alone, they're written once and then used by every run alike
+    return env
+
+
+def measure_steps(env):
+    started = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.boot", "--child"], env=env, cwd=ROOT,
+        capture_output=True, text=True, check=True
+    ).stdout
+    steps = json.loads(output.strip().splitlines()[-1])
+    # the whole process, including starting Python itself and shutting it down
+    steps["process"] = (time.perf_counter() - started) * 1000
+    return steps
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_gunicorn(env, timeout=30):
+    port = free_port()
+    env = dict(env, PORT=str(port), WEB_CONCURRENCY="1")
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "wsgi:app", "--bind", "127.0.0.1:{0}".format(port)],
+        env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                sys.exit("gunicorn stopped with exit code {0}".format(server.returncode))
+            try:
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+                connection.request("GET", "/")
+                status = connection.getresponse().status
+                connection.close()
+            except OSError:
+                time.sleep(0.005)
+                continue
+            if status != 200:
+                sys.exit("the home page answered {0}".format(status))
+            return {"first_response": (time.perf_counter() - started) * 1000}
+        sys.exit("gunicorn didn't answer within {0} seconds".format(timeout))
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def precompile(env):
+    subprocess.run(
+        [sys.executable, "-m", "flask", "precompile-templates"], env=dict(env, FLASK_APP="taskmanager"),
+        cwd=ROOT, capture_output=True, check=True
+    )
+
+
+def median(values):
+    values = sorted(values)
+    middle = len(values) // 2
+    return values[middle] if len(values) % 2 else (values[middle - 1] + values[middle]) / 2
+
+
+def summarise(runs):
+    return {
+        step: {"median": median([run[step] for run in runs]), "min": min(run[step] for run in runs),
+               "max": max(run[step] for run in runs)}
+        for step in runs[0]
+    }
+
+
+def run_key(result):
+    return (result["mode"], result["python"], result["dialect"])
+
+
+def previous_result(result, folder):
+    for path in sorted(glob.glob(os.path.join(folder, "*.json")), reverse=True):
+        with open(path) as file:
+            earlier = json.load(file)
+        if earlier["started"] < result["started"] and run_key(earlier) == run_key(result):
+            return earlier
+    return None
+
+
+def compare(result, earlier, threshold):
+    """Print each median next to the earlier run, and return the ones that got slower than 'threshold'."""
+    regressions = []
+    print("\nCompared with {0} ({1}):".format(earlier["commit"], earlier["started"]))
+    for cache, steps in result["timings"].items():
+        for step, now in steps.items():
+            before = earlier["timings"].get(cache, {}).get(step)
+            if before is None:
+                continue
+            change = (now["median"] - before["median"]) / before["median"] if before["median"] else 0
+            flag = ""
+            # a couple of milliseconds either way is just noise, however large it is in percent
+            if change > threshold and now["median"] - before["median"] > 2:
+                flag = "  REGRESSION"
+                regressions.append("{0} {1}".format(cache, step))
+            print("  {0:<8} {1:<14} {2:8.1f} -> {3:8.1f} ms ({4:+.0%}){5}".format(
+                cache, step, before["median"], now["median"], change, flag
+            ))
+    return regressions
+
+
+def print_table(result):
+    print("{0} runs each, {1}, commit {2}".format(result["runs"], result["mode"], result["commit"]))
+    print("{0:<8} {1:<14} {2:>10} {3:>10} {4:>10}".format("cache", "step", "median ms", "min ms", "max ms"))
+    for cache, steps in result["timings"].items():
+        for step, row in steps.items():
+            print("{0:<8} {1:<14} {2:10.1f} {3:10.1f} {4:10.1f}".format(
+                cache, step, row["median"], row["min"], row["max"]
+            ))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure how long a new worker takes to boot.")
+    parser.add_argument("--database", help="Database URL, the app's own database (DB_URL/DATABASE_URL) by default.")
+    parser.add_argument("--runs", type=int, default=10, help="Fresh processes started for each measurement.")
+    parser.add_argument("--gunicorn", action="store_true", help="Time the real gunicorn server instead of each step.")
+    parser.add_argument("--results", default=RESULTS_FOLDER, help="Folder the results are saved in.")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="How much slower (at the median) a step can get before it counts as a regression.")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with an error after a regression.")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.child:
+        child()
+        return
+
+    # the benchmarks' own imports are only needed out here, where they aren't timed
+    from benchmarks.run import git_commit, save
+    measure = measure_gunicorn if args.gunicorn else measure_steps
+    cache_folder = tempfile.mkdtemp(prefix="jinja-cache-")
+    try:
+        timings = {}
+        for cache in ("cold", "cached"):
+            env = environment(args.database, cache_folder if cache == "cached" else "")
+            if cache == "cached":
+                precompile(env)
+            measure(env)  # one untimed run first, so Python's .pyc files are all written
+            timings[cache] = summarise([measure(env) for _ in range(args.runs)])
+    finally:
+        shutil.rmtree(cache_folder, ignore_errors=True)
+
+    commit, dirty = git_commit()
+    database = args.database or os.environ.get("DB_URL") or os.environ.get("DATABASE_URL") or ""
+    result = {
+        "started": datetime.utcnow().isoformat(timespec="seconds"),
+        "commit": commit,
+        "dirty": dirty,
+        "python": sys.version.split()[0],
+        "mode": "gunicorn" if args.gunicorn else "steps",
+        "dialect": database.split(":", 1)[0].split("+", 1)[0],
+        "runs": args.runs,
+        "timings": timings,
+    }
+    print_table(result)
+    regressions = []
+    if not args.no_save:
+        earlier = previous_result(result, args.results)
+        if earlier is not None:
+            regressions = compare(result, earlier, args.threshold)
+        print("\nSaved to {0}".format(save(result, args.results)))
+    if regressions and args.fail_on_regression:
+        sys.exit("Slower than before: {0}".format(", ".join(regressions)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# Seeded synthetic data for the benchmarks.
+# Fills the category and task tables with as many rows as we like, and the same seed always gives exactly the same data,
+# so two benchmark runs (on two different commits, say) are measured against the same database.
+#
+#   python -m benchmarks.datagen --database sqlite:////tmp/bench.db --categories 10 --tasks-per-category 100000
+#
+# The rows are written straight into the tables in batches of --batch-size, with one commit per batch,
+# which takes a few minutes for a million tasks on SQLite (the full-text index triggers do most of the work).
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from flask_migrate import upgrade
+from taskmanager import create_app, db, stats, versions
+from taskmanager.database import engine_options
+from taskmanager.models import Category, Task
+
+WORDS = (
+    "call email review write plan book pay order fix clean update prepare send check buy renew sort "
+    "report invoice meeting dentist garden car insurance taxes groceries project budget slides "
+    "birthday holiday flights hotel laundry kitchen library parcel contract backup server release"
+).split()
+
+
+def category_names(categories, seed):
+    # at most 25 characters, like the category_name column
+    return ["Bench {0} cat {1:03d}".format(seed, number) for number in range(categories)]
+
+
+def task_rows(category_ids, tasks_per_category, seed, start=None):
+    """Yield one dict per task, 'tasks_per_category' for each category, always the same ones for the same seed."""
+    rng = random.Random(seed)
+    start = start or date.today()
+    number = 0
+    for category_id in category_ids:
+        for _ in range(tasks_per_category):
+            words = rng.choices(WORDS, k=rng.randint(4, 16))
+            yield {
+                # task names must be unique (and no longer than 50 characters)
+                "task_name": "Bench {0} task {1:09d} {2}".format(seed, number, words[0]),
+                "task_description": " ".join(words),
+                "is_urgent": rng.random() < 0.1,
+                "due_date": start + timedelta(days=rng.randint(-30, 365)),
+                "category_id": category_id,
+            }
+            number += 1
+
+
+def generate(categories=10, tasks_per_category=1000, seed=1, batch_size=10000, on_batch=None):
+    """Add 'categories' categories with 'tasks_per_category' tasks each, committing every 'batch_size' tasks.
+
+    'on_batch', if given, is called with the number of tasks written so far after every batch.
+    """
+    names = category_names(categories, seed)
+    if Category.query.filter(Category.category_name.in_(names)).first() is not None:
+        raise ValueError("the database already has the data for seed {0}, use another seed or database".format(seed))
+    db.session.execute(Category.__table__.insert(), [{"category_name": name} for name in names])
+    category_ids = [
+        category_id for category_id, in
+        db.session.query(Category.id).filter(Category.category_name.in_(names)).order_by(Category.category_name)
+    ]
+    stats.add_categories(db.session, category_ids)
+    versions.bump(db.session, "category")
+    db.session.commit()
+
+    written = 0
+    batch = []
+    for row in task_rows(category_ids, tasks_per_category, seed):
+        batch.append(row)
+        if len(batch) == batch_size:
+            written += _write_batch(batch)
+            batch = []
+            if on_batch is not None:
+                on_batch(written)
+    if batch:
+        written += _write_batch(batch)
+        if on_batch is not None:
+            on_batch(written)
+    return written
+
+
+def _write_batch(rows):
+    # one executemany INSERT per batch, skipping the ORM entirely
+    db.session.execute(Task.__table__.insert(), rows)
+    stats.add_rows(db.session, rows)
+    versions.bump(db.session, "task")
+    db.session.commit()
+    return len(rows)
+
+
+def database_config(url):
+    # lets every benchmark script point the app at another database than the one in the environment
+    if not url:
+        return None
+    return {"SQLALCHEMY_DATABASE_URI": url, "SQLALCHEMY_ENGINE_OPTIONS": engine_options(url)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill the database with synthetic categories and tasks.")
+    parser.add_argument("--database", help="Database URL, the app's own database (DB_URL/DATABASE_URL) by default.")
+    parser.add_argument("--categories", type=int, default=10)
+    parser.add_argument("--tasks-per-category", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--no-upgrade", action="store_true", help="Don't run the migrations first.")
+    args = parser.parse_args(argv)
+
+    app = create_app(database_config(args.database))
+    with app.app_context():
+        if not args.no_upgrade:
+            upgrade()
+        total = args.categories * args.tasks_per_category
+        started = time.perf_counter()
+
+        def report(written):
+            elapsed = time.perf_counter() - started
+            print("{0}/{1} tasks, {2:.0f} rows/s".format(written, total, written / elapsed if elapsed else 0))
+        generate(args.categories, args.tasks_per_category, args.seed, args.batch_size, on_batch=report)
+
+
+if __name__ == "__main__":
+    main()
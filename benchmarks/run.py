@@ -0,0 +1,308 @@
+# Runs every scenario (see scenarios.py) and reports its latency, queries per request and peak memory.
+#
+#   python -m benchmarks.run --database sqlite:////tmp/bench.db                      # through the Flask test client
+#   python -m benchmarks.run --database sqlite:////tmp/bench.db --http --concurrency 8   # over HTTP, 8 at a time
+#   python -m benchmarks.run --database postgresql://... --http --url http://127.0.0.1:8000  # against a running server
+#
+# The test client calls the app directly, one request at a time, which shows what each route costs by itself.
+# With --http, the requests go over real sockets from --concurrency threads at once, to a threaded server started
+# in this same process (or to --url), which shows how the routes hold up when they compete for the database.
+# Each run is saved as JSON in benchmarks/results, and compared with the last saved run of the same kind,
+# so a commit that makes a route slower, or makes it run more queries, shows up straight away.
+import argparse
+import glob
+import http.client
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode, urlsplit
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.serving import make_server
+from benchmarks.datagen import database_config
+from benchmarks.scenarios import BenchmarkData, scenarios
+from taskmanager import create_app, db
+
+RESULTS_FOLDER = os.path.join(os.path.dirname(__file__), "results")
+SCENARIO_HEADER = "X-Benchmark-Scenario"
+
+
+class QueryCounter:
+    # Counts the SQL statements run while answering each scenario's requests. The scenario name travels in a
+    # request header, so this works the same for the test client and for the threaded HTTP server.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = Counter()
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context():
+            scenario = request.headers.get(SCENARIO_HEADER)
+            if scenario:
+                with self.lock:
+                    self.counts[scenario] += 1
+
+
+def percentile(values, percent):
+    # nearest-rank percentile of an already sorted list
+    if not values:
+        return None
+    index = max(int(round(percent / 100.0 * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def summarise(latencies, errors, queries, peak_memory):
+    latencies = sorted(latencies)
+    count = len(latencies)
+    return {
+        "requests": count,
+        "errors": errors,
+        # in milliseconds
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "mean": sum(latencies) / count if count else None,
+        "queries_per_request": queries / count if count and queries is not None else None,
+        "peak_memory_kb": peak_memory,
+    }
+
+
+def run_with_client(app, scenario, requests):
+    client = app.test_client()
+    latencies = []
+    errors = 0
+    for _ in range(requests):
+        method, path, form = scenario.request()
+        started = time.perf_counter()
+        response = client.open(path, method=method, data=form, headers={SCENARIO_HEADER: scenario.name})
+        response.get_data()
+        elapsed = (time.perf_counter() - started) * 1000
+        latencies.append(elapsed)
+        errors += response.status_code >= 400
+    return latencies, errors
+
+
+def run_with_http(url, scenario, requests, concurrency):
+    address = urlsplit(url)
+    local = threading.local()
+    lock = threading.Lock()
+    latencies = []
+    errors = []
+
+    def send(_):
+        # every thread keeps its own keep-alive connection
+        if getattr(local, "connection", None) is None:
+            local.connection = http.client.HTTPConnection(address.hostname, address.port or 80, timeout=60)
+        method, path, form = scenario.request()
+        headers = {SCENARIO_HEADER: scenario.name}
+        body = None
+        if form is not None:
+            body = urlencode(form)
+            headers["Content-Type"] = "application/x-www-form-urlencoded"
+        started = time.perf_counter()
+        try:
+            local.connection.request(method, path, body=body, headers=headers)
+            response = local.connection.getresponse()
+            response.read()
+            failed = response.status >= 400
+        except (OSError, http.client.HTTPException):
+            local.connection.close()
+            local.connection = None
+            failed = True
+        elapsed = (time.perf_counter() - started) * 1000
+        with lock:
+            latencies.append(elapsed)
+            errors.append(failed)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(send, range(requests)))
+    return latencies, sum(errors)
+
+
+def git_commit():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True, check=True
+        ).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def _rounded(number):
+    # two significant figures, so the few tasks that add_task POST leaves behind don't make every run look different
+    return float("{0:.2g}".format(number))
+
+
+def run_key(result):
+    # runs are only compared with earlier runs of the same kind, on about the same amount of data
+    # (tracemalloc slows everything down, so runs with and without it aren't compared either)
+    return (
+        result["mode"], result["concurrency"], result["trace_memory"], result["dialect"],
+        _rounded(result["categories"]), _rounded(result["tasks"])
+    )
+
+
+def save(result, folder):
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, "{0}-{1}-{2}.json".format(
+        result["started"].replace(":", "").replace("-", ""), result["commit"] or "nocommit", result["mode"]
+    ))
+    with open(path, "w") as file:
+        json.dump(result, file, indent=2, sort_keys=True)
+    return path
+
+
+def previous_result(result, folder):
+    for path in sorted(glob.glob(os.path.join(folder, "*.json")), reverse=True):
+        with open(path) as file:
+            earlier = json.load(file)
+        if earlier["started"] < result["started"] and run_key(earlier) == run_key(result):
+            return earlier
+    return None
+
+
+def compare(result, earlier, threshold):
+    """Print each scenario next to the earlier run, and return the names of the ones that got worse."""
+    regressions = []
+    print("\nCompared with {0} ({1}):".format(earlier["commit"], earlier["started"]))
+    for name, now in result["scenarios"].items():
+        before = earlier["scenarios"].get(name)
+        if before is None or before["p95"] is None or now["p95"] is None:
+            continue
+        change = (now["p95"] - before["p95"]) / before["p95"] if before["p95"] else 0
+        more_queries = (
+            now["queries_per_request"] is not None and before["queries_per_request"] is not None
+            and now["queries_per_request"] > before["queries_per_request"] + 0.01
+        )
+        flag = ""
+        if change > threshold or more_queries:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print("  {0:<16} p95 {1:8.2f} -> {2:8.2f} ms ({3:+.0%}), queries {4} -> {5}{6}".format(
+            name, before["p95"], now["p95"], change,
+            _number(before["queries_per_request"]), _number(now["queries_per_request"]), flag
+        ))
+    return regressions
+
+
+def _number(value):
+    return "-" if value is None else "{0:.1f}".format(value)
+
+
+def print_table(result):
+    print("{0} requests per scenario, {1}, {2} categories, {3} tasks, commit {4}".format(
+        result["requests"], result["mode"], result["categories"], result["tasks"], result["commit"]
+    ))
+    print("{0:<16} {1:>8} {2:>8} {3:>8} {4:>8} {5:>8} {6:>10}".format(
+        "scenario", "p50 ms", "p95 ms", "p99 ms", "queries", "errors", "peak KB"
+    ))
+    for name, row in result["scenarios"].items():
+        print("{0:<16} {1:8.2f} {2:8.2f} {3:8.2f} {4:>8} {5:8d} {6:>10}".format(
+            name, row["p50"], row["p95"], row["p99"], _number(row["queries_per_request"]), row["errors"],
+            "-" if row["peak_memory_kb"] is None else row["peak_memory_kb"]
+        ))
+    print("peak RSS of the whole run: {0} KB".format(result["peak_rss_kb"]))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the task manager's routes.")
+    parser.add_argument("--database", help="Database URL, the app's own database (DB_URL/DATABASE_URL) by default.")
+    parser.add_argument("--requests", type=int, default=200, help="Timed requests per scenario.")
+    parser.add_argument("--warmup", type=int, default=10, help="Untimed requests sent first, per scenario.")
+    parser.add_argument("--http", action="store_true", help="Send real HTTP requests instead of using the test client.")
+    parser.add_argument("--url", help="With --http, a server that is already running, instead of a built-in one.")
+    parser.add_argument("--concurrency", type=int, default=4, help="With --http, requests in flight at once.")
+    parser.add_argument("--scenario", action="append", help="Only run this scenario (can be repeated).")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--delete-size", type=int, default=100, help="Tasks in each category that gets deleted.")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="Measure the peak Python memory of each scenario with tracemalloc (slower).")
+    parser.add_argument("--results", default=RESULTS_FOLDER, help="Folder the results are saved in.")
+    parser.add_argument("--no-save", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="How much slower (at p95) a scenario can get before it counts as a regression.")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with an error after a regression.")
+    args = parser.parse_args(argv)
+
+    app = create_app(database_config(args.database))
+    data = BenchmarkData(app, seed=args.seed, delete_size=args.delete_size)
+    selected = [scenario for scenario in scenarios(data) if not args.scenario or scenario.name in args.scenario]
+    counter = QueryCounter()
+    event.listen(Engine, "before_cursor_execute", counter)
+
+    server = None
+    url = args.url
+    if args.http and not url:
+        server = make_server("127.0.0.1", 0, app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = "http://127.0.0.1:{0}".format(server.server_port)
+    if args.trace_memory:
+        tracemalloc.start()
+
+    commit, dirty = git_commit()
+    with app.app_context():
+        dialect = db.engine.dialect.name
+    result = {
+        "started": datetime.utcnow().isoformat(timespec="seconds"),
+        "commit": commit,
+        "dirty": dirty,
+        "python": sys.version.split()[0],
+        "mode": "http" if args.http else "client",
+        "concurrency": args.concurrency if args.http else 1,
+        "trace_memory": args.trace_memory,
+        "dialect": dialect,
+        "categories": data.categories,
+        "tasks": data.tasks,
+        "requests": args.requests,
+        "scenarios": {},
+    }
+    try:
+        for scenario in selected:
+            if args.http:
+                def send(requests):
+                    return run_with_http(url, scenario, requests, args.concurrency)
+            else:
+                def send(requests):
+                    return run_with_client(app, scenario, requests)
+            # the warm-up requests fill the caches and connection pools, and aren't measured
+            send(args.warmup)
+            counter.counts[scenario.name] = 0
+            if args.trace_memory:
+                tracemalloc.reset_peak()
+            latencies, errors = send(args.requests)
+            # queries can only be counted when the app runs in this process
+            queries = None if args.url else counter.counts[scenario.name]
+            peak_memory = tracemalloc.get_traced_memory()[1] // 1024 if args.trace_memory else None
+            result["scenarios"][scenario.name] = summarise(latencies, errors, queries, peak_memory)
+    finally:
+        event.remove(Engine, "before_cursor_execute", counter)
+        if server is not None:
+            server.shutdown()
+    # on Linux, ru_maxrss is already in kilobytes
+    result["peak_rss_kb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    print_table(result)
+    regressions = []
+    if not args.no_save:
+        earlier = previous_result(result, args.results)
+        if earlier is not None:
+            regressions = compare(result, earlier, args.threshold)
+        print("\nSaved to {0}".format(save(result, args.results)))
+    if regressions and args.fail_on_regression:
+        sys.exit("Slower than before: {0}".format(", ".join(regressions)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# The requests each benchmark sends, one scenario per route (and per method, for the forms).
+# Every scenario has a 'request' function, which returns the (method, path, form data) of the next request to send.
+# It is called outside the timed part, so it can also prepare the database first, like delete_category does.
+import itertools
+import random
+import threading
+from collections import namedtuple
+from datetime import date, timedelta
+from taskmanager import db, stats, versions
+from taskmanager.models import Category, Task
+
+Scenario = namedtuple("Scenario", ["name", "request"])
+
+
+class BenchmarkData:
+    """What the scenarios need to know about the database: some existing task and category IDs."""
+
+    def __init__(self, app, seed=1, sample_size=200, delete_size=100):
+        self.app = app
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.delete_size = delete_size
+        self.counter = itertools.count()
+        with app.app_context():
+            self.categories = db.session.query(db.func.count(Category.id)).scalar()
+            self.tasks = db.session.query(db.func.count(Task.id)).scalar()
+            self.category_id = db.session.query(Category.id).order_by(Category.id).limit(1).scalar()
+            self.task_ids = self._sample_task_ids(sample_size)
+        if not self.task_ids:
+            raise ValueError("there are no tasks to benchmark with, run benchmarks.datagen first")
+        # every run gets its own names, so new tasks and categories never clash with an earlier run
+        self.run_id = "{0:06x}".format(random.getrandbits(24))
+
+    def _sample_task_ids(self, size):
+        # picking random points between the lowest and highest ID, and taking the next task from there,
+        # avoids ORDER BY random(), which would read the whole table
+        low, high = db.session.query(db.func.min(Task.id), db.func.max(Task.id)).one()
+        if low is None:
+            return []
+        ids = set()
+        for _ in range(size):
+            start = self.rng.randint(low, high)
+            ids.add(db.session.query(Task.id).filter(Task.id >= start).order_by(Task.id).limit(1).scalar())
+        return sorted(ids)
+
+    def random_task_id(self):
+        with self.rng_lock:
+            return self.rng.choice(self.task_ids)
+
+    def unique_name(self, prefix):
+        return "{0} {1} {2}".format(prefix, self.run_id, next(self.counter))
+
+    def task_form(self, name):
+        return {
+            "task_name": name,
+            "task_description": "Added by the benchmark",
+            "due_date": (date.today() + timedelta(days=7)).strftime("%d %B, %Y"),
+            "category_id": str(self.category_id),
+        }
+
+    def new_category_with_tasks(self):
+        # the category deleted by each delete_category request, written straight into the database
+        with self.app.app_context():
+            name = self.unique_name("Del")[:25]
+            category_id = db.session.execute(
+                Category.__table__.insert().values(category_name=name)
+            ).inserted_primary_key[0]
+            if self.delete_size:
+                due_date = date.today()
+                rows = [
+                    {
+                        "task_name": "{0} task {1}".format(name, number),
+                        "task_description": "Deleted by the benchmark",
+                        "is_urgent": False,
+                        "due_date": due_date,
+                        "category_id": category_id,
+                    }
+                    for number in range(self.delete_size)
+                ]
+                db.session.execute(Task.__table__.insert(), rows)
+                stats.add_rows(db.session, rows)
+            versions.bump(db.session, "category", "task")
+            db.session.commit()
+            return category_id
+
+
+def scenarios(data):
+    """Every scenario, in the order they run."""
+    def home():
+        return "GET", "/", None
+
+    def categories():
+        return "GET", "/categories", None
+
+    def dashboard():
+        return "GET", "/dashboard", None
+
+    def add_task_form():
+        return "GET", "/add_task", None
+
+    def add_task():
+        return "POST", "/add_task", data.task_form(data.unique_name("Bench new"))
+
+    def edit_task_form():
+        return "GET", "/edit_task/{0}".format(data.random_task_id()), None
+
+    def edit_task():
+        # the task keeps its name, which has to stay unique, and gets a new description and due date
+        task_id = data.random_task_id()
+        form = data.task_form("")
+        with data.app.app_context():
+            form["task_name"] = db.session.query(Task.task_name).filter(Task.id == task_id).scalar()
+        return "POST", "/edit_task/{0}".format(task_id), form
+
+    def delete_category():
+        return "GET", "/delete_category/{0}".format(data.new_category_with_tasks()), None
+
+    return [
+        Scenario("home", home),
+        Scenario("categories", categories),
+        Scenario("dashboard", dashboard),
+        Scenario("add_task GET", add_task_form),
+        Scenario("add_task POST", add_task),
+        Scenario("edit_task GET", edit_task_form),
+        Scenario("edit_task POST", edit_task),
+        Scenario("delete_category", delete_category),
+    ]
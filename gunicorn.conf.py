@@ -0,0 +1,55 @@
+# Settings for gunicorn, the production web server (see the Procfile and wsgi.py).
+# gunicorn reads this file by itself, as long as it's started from this folder.
+import os
+import shutil
+import tempfile
+
+bind = "0.0.0.0:{0}".format(os.environ.get("PORT", "8000"))
+
+# Several worker processes, each answering a few requests at once on its own threads ("gthread").
+# Heroku sets WEB_CONCURRENCY to suit the size of the dyno, and GUNICORN_THREADS can be set alongside it.
+# Every thread may need a database connection of its own, so threads should be no more than DB_POOL_SIZE
+# (see database.py), and workers * DB_POOL_SIZE no more than the database (or its PgBouncer) accepts.
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+
+# Builds the app (and loads its templates) once, before forking the workers, instead of once in every worker.
+# Nothing in wsgi.py connects to the database, so the workers never share a connection: each one opens its own.
+preload_app = True
+
+# Heroku's router gives up on a request after 30 seconds, so there's no point in a worker going on for longer.
+timeout = 30
+graceful_timeout = 20
+keepalive = 5
+
+# Restarting each worker after a while keeps any slow memory growth in check. With preload_app,
+# a new worker is a fork of the main process, so it's ready straight away.
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 1000))
+max_requests_jitter = 100
+
+# the workers' heartbeat files, kept in memory rather than on a disk that might be slow
+worker_tmp_dir = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+# Every worker writes its /metrics numbers to this folder, so that whichever worker answers the scrape can add them
+# all up (see instrumentation.py). prometheus_client checks for it when it's first imported, which, with
+# preload_app, is when the app is loaded, right after this file is read.
+os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(worker_tmp_dir or tempfile.gettempdir(), "taskmanager-metrics")
+)
+
+
+def on_starting(server):
+    # the numbers left from the last time gunicorn ran would otherwise be added to the new ones
+    folder = os.environ["PROMETHEUS_MULTIPROC_DIR"]
+    shutil.rmtree(folder, ignore_errors=True)
+    os.makedirs(folder)
+
+
+def child_exit(server, worker):
+    # a stopped worker's counters are kept, they still count towards the totals, only its "live" gauges are dropped
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
+accesslog = "-"
+errorlog = "-"
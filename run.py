@@ -3,9 +3,14 @@
 # Since it will run the whole application, we just call it "run.py".
 
 import os # we import os in order to utilize "environment variables" within this file.
-from taskmanager import app # import the 'app' variable that we've created within our taskmanager package 
+from taskmanager import create_app # import the create_app() function from within our taskmanager package
 
-# defined in the init file. The last step to run our application is to tell our app how and where to run the application.
+# defined in the init file, and build our app with it.
+app = create_app()
+# run.py starts Flask's own development server, which is handy locally. In production, the Procfile starts
+# gunicorn with wsgi.py instead, since the development server only answers one request at a time.
+
+# The last step to run our application is to tell our app how and where to run the application.
 if __name__ == "__main__": 
     app.run(
         host=os.environ.get("IP"),
@@ -1,38 +1,121 @@
-# This will make sure to initialize our taskmanager application as a package, 
+# This will make sure to initialize our taskmanager application as a package,
 # allowing us to use our own imports, as well as any standard imports.
+import logging
 import os
-import re
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-if os.path.exists("env.py"): 
+from taskmanager.database import RoutingSQLAlchemy, engine_options
+if os.path.exists("env.py"):
     import env # noqa
 # since we are not pushing the "env.py" file to GitHub, this file will not be visible once deployed to Heroku, and will throw an error.
 # This is why we need to only import 'env' if the OS can find an existing file path for the env.py file itself.
 
-# CREATE A FLASK APPLICATION OBJECT
-app = Flask(__name__)
-app.config["SECRET_KEY"] = os.environ.get("SECRET_KEY")
-if os.environ.get("DEVELOPMENT") == "True":
-    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DB_URL")  # local
-else:
-    uri = os.environ.get("DATABASE_URL")
-    if uri.startswith("postgres://"):
+# create an instance of our SQLAlchemy class (Flask-SQLAlchemy, plus read-replica routing from database.py),
+# which will be assigned to a variable of 'db'. It isn't tied to any particular Flask 'app' yet,
+# that happens inside create_app() below, with db.init_app(app).
+db = RoutingSQLAlchemy()
+
+logger = logging.getLogger(__name__)
+
+
+def database_url(uri):
+    # Heroku still hands out "postgres://" URLs, which SQLAlchemy no longer accepts
+    if uri and uri.startswith("postgres://"):
         uri = uri.replace("postgres://", "postgresql://", 1)
-    app.config["SQLALCHEMY_DATABASE_URI"] = uri  # heroku
-# create an instance of the imported Flask() class, which takes the default 
-# Flask __name__ module, and that will be stored in a variable called 'app',
-# We specify two app configuration variables, and these will both come from our environment variables.
-# app.config SECRET_KEY and app.config SQLALCHEMY_DATABASE_URI, both wrapped in square brackets and quotes.
-# Each of these will be set to get their respective environment variable, which is SECRET_KEY,
-# and the short and sweet DB_URL for the database location which we'll set up later.
-
-# create an instance of the imported SQLAlchemy() class, which will be
-# assigned to a variable of 'db', and set to the instance of our Flask 'app'
-db = SQLAlchemy(app)
-
-from taskmanager import routes # noqa for 'No Quality Assurance'
-# the linting is complaining about custom import not added at the top of the file with the other imports.
-# The reason this is being imported last is because the 'routes' file will rely on using both the 'app' and 'db' variables defined above.
-# If we try to import routes before 'app' and 'db' are defined, we'll get "circular-import errors", 
+    return uri
+
+
+def config_from_env():
+    config = {}
+    config["SECRET_KEY"] = os.environ.get("SECRET_KEY")
+    if os.environ.get("DEVELOPMENT") == "True":
+        config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DB_URL")  # local
+    else:
+        config["SQLALCHEMY_DATABASE_URI"] = database_url(os.environ.get("DATABASE_URL"))  # heroku
+    config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(config["SQLALCHEMY_DATABASE_URI"])
+    config["SQLALCHEMY_BINDS"] = {}
+    if os.environ.get("DB_REPLICA_URL"):
+        config["SQLALCHEMY_BINDS"]["replica"] = database_url(os.environ.get("DB_REPLICA_URL"))
+    config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    config["DB_REPLICA_STICKY_SECONDS"] = int(os.environ.get("DB_REPLICA_STICKY_SECONDS", 5))
+    config["TASKS_PER_PAGE"] = int(os.environ.get("TASKS_PER_PAGE", 25))
+    config["API_MAX_BATCH_SIZE"] = int(os.environ.get("API_MAX_BATCH_SIZE", 1000))
+    config["IMPORT_CHUNK_SIZE"] = int(os.environ.get("IMPORT_CHUNK_SIZE", 1000))
+    config["API_IMPORT_MAX_BYTES"] = int(os.environ.get("API_IMPORT_MAX_BYTES", 2 * 1024 * 1024))
+    config["CATEGORY_CACHE_TTL"] = int(os.environ.get("CATEGORY_CACHE_TTL", 60))
+    config["CATEGORY_CACHE_SIZE"] = int(os.environ.get("CATEGORY_CACHE_SIZE", 16))
+    config["CATEGORY_DELETE_BACKGROUND_THRESHOLD"] = int(os.environ.get("CATEGORY_DELETE_BACKGROUND_THRESHOLD", 10000))
+    config["CATEGORY_DELETE_BATCH_SIZE"] = int(os.environ.get("CATEGORY_DELETE_BATCH_SIZE", 1000))
+    config["INSTRUMENTATION"] = os.environ.get("INSTRUMENTATION", "True") == "True"
+    config["SLOW_QUERY_MS"] = float(os.environ.get("SLOW_QUERY_MS", 100))
+    config["N_PLUS_ONE_THRESHOLD"] = int(os.environ.get("N_PLUS_ONE_THRESHOLD", 5))
+    config["JINJA_BYTECODE_CACHE"] = os.environ.get(
+        "JINJA_BYTECODE_CACHE", os.path.join(os.path.dirname(__file__), ".jinja-cache")
+    )
+    return config
+# Every setting comes from our environment variables.
+# SECRET_KEY, and either the short and sweet DB_URL for the local database, or DATABASE_URL on Heroku, are required.
+# DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE and DB_POOL_PRE_PING tune the connection pool
+# (see engine_options() in database.py), and DB_REPLICA_URL adds a read-only replica database. Right after a change,
+# a browser keeps reading from the primary for DB_REPLICA_STICKY_SECONDS, while the replica catches up.
+# SQLALCHEMY_TRACK_MODIFICATIONS is switched off, since nothing uses its signals and they cost time on every flush.
+# TASKS_PER_PAGE is optional, and controls how many tasks are shown on each page of the home page.
+# API_MAX_BATCH_SIZE is optional too, and caps how many items one request to the JSON API can send.
+# IMPORT_CHUNK_SIZE sets how many rows of an uploaded file are written and committed together.
+# API_IMPORT_MAX_BYTES is the largest file /api/v1/tasks/import accepts, larger ones go through "flask import-tasks".
+# CATEGORY_CACHE_TTL (in seconds) and CATEGORY_CACHE_SIZE limit how long, and how much, the category cache keeps.
+# The TTL is also how long another worker's category changes can take to show up in the task forms (see caching.py).
+# Categories with more tasks than CATEGORY_DELETE_BACKGROUND_THRESHOLD are deleted in the background,
+# CATEGORY_DELETE_BATCH_SIZE tasks at a time. Setting the threshold to 0 always deletes them straight away.
+# INSTRUMENTATION (on unless set to anything but "True") adds the Server-Timing header and the /metrics page,
+# and logs requests that run one statement N_PLUS_ONE_THRESHOLD times, or a statement slower than SLOW_QUERY_MS.
+# JINJA_BYTECODE_CACHE is the folder the compiled templates are kept in (see templating.py), or "" for none at all.
+
+
+# CREATE A FLASK APPLICATION OBJECT
+def create_app(config=None, commands=True):
+    app = Flask(__name__)
+    app.config.update(config_from_env())
+    if config is not None:
+        app.config.update(config)
+    # create an instance of the imported Flask() class, which takes the default Flask __name__ module.
+    # Any 'config' passed in replaces the settings from the environment, which is handy for tests and scripts.
+    if not app.config["SQLALCHEMY_DATABASE_URI"]:
+        logger.warning("Neither DB_URL (with DEVELOPMENT=True) nor DATABASE_URL is set, so there's no database")
+    # Nothing connects to the database until the first query, so the app can still be built without one,
+    # for example to precompile the templates while the slug is built on Heroku.
+
+    db.init_app(app)
+
+    from taskmanager import instrumentation, templating
+    from taskmanager.api import api
+    from taskmanager.routes import main
+    app.register_blueprint(main)
+    app.register_blueprint(api)
+    templating.init_app(app)
+    instrumentation.init_app(app)
+    if commands:
+        init_commands(app)
+    return app
+# The reason these are imported inside the function is because the 'routes' file (and the others) rely on the 'db' variable defined above.
+# If we try to import routes before 'db' is defined, we'll get "circular-import errors",
 # meaning those variables aren't yet available to use, as they're defined after the routes.
-# These linting warnings are technically not accurate, so to stop the warnings, add a comment at the end of each line: # noqa for 'No Quality Assurance'.
\ No newline at end of file
+# The web server (wsgi.py) passes commands=False, since it never runs any "flask ..." commands.
+
+
+def init_commands(app):
+    # Flask-Migrate wraps Alembic, and gives us the "flask db ..." commands for versioned schema changes.
+    # Importing Alembic takes about as long as the rest of the app put together, which is why it's only
+    # imported here, and not at the top of this file.
+    from flask_migrate import Migrate
+    from taskmanager import cli
+    from taskmanager.search import include_object
+    Migrate(
+        app, db, directory=os.path.join(os.path.dirname(__file__), "migrations"), render_as_batch=True,
+        include_object=include_object
+    )
+    # The migration scripts live inside our package, in "taskmanager/migrations", and render_as_batch lets
+    # Alembic alter tables on SQLite too, by copying them into a new table behind the scenes.
+    # include_object keeps "flask db migrate" away from the full-text search objects, which aren't in models.py.
+    cli.init_app(app)
+# There's no 'app' created when this package is imported: run.py, wsgi.py and the "flask" command
+# (which finds create_app() by itself, with FLASK_APP=taskmanager) each build their own.
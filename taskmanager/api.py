@@ -0,0 +1,193 @@
+# A JSON API for integrations that need to create, update or delete many tasks or categories at once.
+# Every endpoint takes a JSON array, writes the whole array in one transaction (see bulk.py for how),
+# and answers with one result per item, in the same order, so a client can tell exactly which items failed:
+#   {"results": [{"index": 0, "status": "created", "id": 7}, {"index": 1, "status": "error", "error": "..."}],
+#    "errors": 1}
+from datetime import date
+import io
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+from taskmanager import bulk, db, export, importer, stats
+from taskmanager.database import use_replica
+
+api = Blueprint("api", __name__, url_prefix="/api/v1")
+
+DUPLICATE_MODES = ("error", "skip", "update")
+
+
+@api.errorhandler(HTTPException)
+def json_error(error):
+    # API clients expect JSON back, even when something goes wrong, instead of Flask's HTML error pages
+    return jsonify(error=error.description), error.code
+
+
+def get_batch():
+    items = request.get_json(silent=True)
+    if not isinstance(items, list):
+        abort(400, "The request body must be a JSON array.")
+    limit = current_app.config["API_MAX_BATCH_SIZE"]
+    if len(items) > limit:
+        abort(413, "A batch can contain at most {0} items.".format(limit))
+    return items
+
+
+def write_batch(operation, items):
+    # runs one of the bulk.py functions and commits its batch as a single transaction
+    try:
+        results = operation(items)
+        db.session.commit()
+    except IntegrityError:
+        # another request changed the same rows in the meantime, so nothing from this batch is kept
+        db.session.rollback()
+        abort(409, "The batch conflicts with rows that changed in the meantime, please retry it.")
+    errors = sum(1 for result in results if result["status"] == "error")
+    status = 201 if any(result["status"] == "created" for result in results) else 200
+    return jsonify(results=results, errors=errors), status
+
+
+@api.route("/tasks", methods=["POST"])
+def create_tasks():
+    on_duplicate = request.args.get("on_duplicate", "error")
+    if on_duplicate not in DUPLICATE_MODES:
+        abort(400, "'on_duplicate' must be one of: {0}.".format(", ".join(DUPLICATE_MODES)))
+    return write_batch(
+        lambda items: bulk.create_tasks(items, on_duplicate=on_duplicate), get_batch()
+    )
+
+
+@api.route("/tasks", methods=["PATCH"])
+def update_tasks():
+    return write_batch(bulk.update_tasks, get_batch())
+
+
+@api.route("/tasks", methods=["DELETE"])
+def delete_tasks():
+    return write_batch(bulk.delete_tasks, get_batch())
+
+
+@api.route("/categories", methods=["POST"])
+def create_categories():
+    return write_batch(bulk.create_categories, get_batch())
+
+
+@api.route("/categories", methods=["PATCH"])
+def update_categories():
+    return write_batch(bulk.update_categories, get_batch())
+
+
+@api.route("/categories", methods=["DELETE"])
+def delete_categories():
+    return write_batch(bulk.delete_categories, get_batch())
+
+
+def _date_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        abort(400, "'{0}' must be a date in the format YYYY-MM-DD.".format(name))
+
+
+def _bool_arg(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    if value.lower() in ("1", "true", "yes"):
+        return True
+    if value.lower() in ("0", "false", "no"):
+        return False
+    abort(400, "'{0}' must be true or false.".format(name))
+
+
+@api.route("/tasks/export")
+def export_tasks():
+    output_format = request.args.get("format", "csv")
+    if output_format not in export.FORMATS:
+        abort(400, "'format' must be one of: {0}.".format(", ".join(export.FORMATS)))
+    chunks = export.export_tasks(
+        output_format,
+        category_id=request.args.get("category_id", type=int),
+        category_name=request.args.get("category") or None,
+        urgent=_bool_arg("urgent"),
+        due_from=_date_arg("due_from"),
+        due_to=_date_arg("due_to")
+    )
+    # stream_with_context() keeps the request (and its database session) alive while the generator runs,
+    # so each chunk is sent to the client as soon as it's ready, instead of building the whole file in memory
+    return Response(
+        stream_with_context(chunks),
+        mimetype=export.FORMATS[output_format],
+        headers={"Content-Disposition": "attachment; filename=tasks.{0}".format(output_format)}
+    )
+
+
+@api.route("/stats")
+@use_replica
+def task_stats():
+    return jsonify(stats.summary())
+
+
+@api.route("/tasks/import", methods=["POST"])
+def import_tasks():
+    # checked before the upload is read at all, see the notes below
+    limit = current_app.config["API_IMPORT_MAX_BYTES"]
+    if request.content_length is None:
+        abort(411, "Send the upload with a Content-Length header.")
+    if request.content_length > limit:
+        abort(413, "Uploads are limited to {0} bytes. Import larger files with 'flask import-tasks', "
+                   "or split them up.".format(limit))
+    upload = request.files.get("file")
+    if upload is None:
+        abort(400, "Upload the tasks as a multipart form field called 'file'.")
+    input_format = request.args.get("format") or upload.filename.rsplit(".", 1)[-1].lower()
+    if input_format not in importer.FORMATS:
+        abort(400, "'format' must be one of: {0}.".format(", ".join(importer.FORMATS)))
+    on_duplicate = request.args.get("on_duplicate", "skip")
+    if on_duplicate not in DUPLICATE_MODES:
+        abort(400, "'on_duplicate' must be one of: {0}.".format(", ".join(DUPLICATE_MODES)))
+
+    committed = {"rows": request.args.get("start_row", 0, type=int)}
+    try:
+        progress = importer.import_tasks(
+            io.TextIOWrapper(upload.stream, encoding="utf-8", newline=""),
+            input_format,
+            chunk_size=current_app.config["IMPORT_CHUNK_SIZE"],
+            on_duplicate=on_duplicate,
+            start_row=committed["rows"],
+            on_chunk=lambda progress: committed.update(rows=progress.rows)
+        )
+    except IntegrityError:
+        abort(409, "A chunk conflicted with rows that changed in the meantime. The first {0} rows were imported, "
+                   "send the file again with start_row={0} to carry on.".format(committed["rows"]))
+    return jsonify(
+        rows=progress.rows,
+        created=progress.counts["created"],
+        updated=progress.counts["updated"],
+        skipped=progress.counts["skipped"],
+        errors=progress.counts["error"],
+        # only the first hundred errors are listed, a file full of bad rows shouldn't make a huge response
+        error_rows=[{"row": row, "error": error} for row, error in progress.errors[:100]],
+        rows_per_second=round(progress.rows_per_second, 1)
+    )
+
+# For example, to add two tasks and then delete one of them by name:
+#   curl -X POST /api/v1/tasks -H "Content-Type: application/json" -d '[
+#       {"task_name": "Pay bills", "task_description": "Gas and electric", "due_date": "2022-09-05", "category_name": "Home"},
+#       {"task_name": "Book flights", "task_description": "For the summer", "due_date": "2022-10-01", "category_id": 2, "is_urgent": true}]'
+#   curl -X DELETE /api/v1/tasks -H "Content-Type: application/json" -d '["Pay bills"]'
+# Existing rows are found by "id", or by their unique "task_name" / "category_name" when there's no "id".
+# POST /api/v1/tasks?on_duplicate=skip (or =update) treats tasks whose name already exists as skipped (or updated)
+# instead of as errors, which makes re-sending the same batch safe.
+# GET /api/v1/tasks/export?format=ndjson&category=Home&urgent=true&due_from=2022-01-01&due_to=2022-12-31
+# streams every matching task, with any combination of those filters, as CSV (the default) or NDJSON.
+# POST /api/v1/tasks/import, with a CSV or NDJSON file in a form field called "file", imports it in chunks,
+# skipping tasks that already exist unless ?on_duplicate=update (or =error) says otherwise.
+# The whole file is imported while the request waits, and gunicorn stops any worker that takes more than
+# 30 seconds (see gunicorn.conf.py), before it could tell the client how many rows were committed. So files larger
+# than API_IMPORT_MAX_BYTES (2 MB, around 25,000 rows, by default) are turned away with a 413 before being read,
+# as are uploads without a Content-Length. "flask import-tasks" has no such limit, and records its own progress.
+# GET /api/v1/stats returns the dashboard numbers: {"categories": [{"id": 1, "category_name": "Home", "tasks": 12,
+# "urgent": 3, "overdue": 1, "due_this_week": 4}, ...], "totals": {"tasks": 12, "urgent": 3, ...}}
@@ -0,0 +1,378 @@
+# Batched create, update and delete of tasks and categories.
+# The routes in routes.py handle one row per form post, which is fine for people, but far too slow for integrations
+# that send thousands of tasks at a time. The functions below take a whole list of items instead, look up everything
+# they need with one query per batch, and write all the rows with a handful of multi-row statements.
+# They never commit: the caller decides where the transaction ends, so that one batch is always one transaction.
+from datetime import date
+from taskmanager import db, stats, versions
+from taskmanager.models import Category, Task
+
+
+class ItemError(ValueError):
+    # Raised when a single item in a batch is invalid. It only fails that item, and the rest of the batch carries on.
+    pass
+
+
+def _error(index, error):
+    return {"index": index, "status": "error", "error": str(error)}
+
+
+def _ok(index, status, row_id):
+    return {"index": index, "status": status, "id": row_id}
+
+
+def _text(item, field, max_length=None):
+    value = item.get(field)
+    if not isinstance(value, str) or not value.strip():
+        raise ItemError("'{0}' is required".format(field))
+    if max_length is not None and len(value) > max_length:
+        raise ItemError("'{0}' must be at most {1} characters".format(field, max_length))
+    return value
+
+
+def _integer(value, field):
+    # bool is a subclass of int in Python, but "id": true is certainly a mistake
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ItemError("'{0}' must be an integer".format(field))
+    return value
+
+
+def _due_date(item):
+    value = item.get("due_date")
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ItemError("'due_date' must be a date in the format YYYY-MM-DD")
+
+
+def _is_urgent(item):
+    value = item.get("is_urgent", False)
+    if not isinstance(value, bool):
+        raise ItemError("'is_urgent' must be true or false")
+    return value
+
+
+def _category_ref(item):
+    # a task can point to its category either by ID or by its (unique) name
+    if item.get("category_id") is not None:
+        return ("id", _integer(item["category_id"], "category_id"))
+    if item.get("category_name") is not None:
+        return ("name", _text(item, "category_name", 25))
+    raise ItemError("either 'category_id' or 'category_name' is required")
+
+
+def _row_ref(item, name_field):
+    # existing rows are found by their ID, or by their unique name column when there is no ID.
+    # Plain integers and strings are accepted too, which keeps delete requests short: [1, 2, "Pay bills"]
+    if isinstance(item, dict):
+        if item.get("id") is not None:
+            return ("id", _integer(item["id"], "id"))
+        if item.get(name_field) is not None:
+            return ("name", _text(item, name_field))
+    elif isinstance(item, str) and item.strip():
+        return ("name", item)
+    elif isinstance(item, int) and not isinstance(item, bool):
+        return ("id", item)
+    raise ItemError("either 'id' or '{0}' is required to find an existing row".format(name_field))
+
+
+def _resolve(model, name_column, refs):
+    # Turns a collection of ("id", 3) / ("name", "Work") references into a {reference: id} dictionary
+    # for the rows that exist, using a single query however many references there are.
+    ids = {value for kind, value in refs if kind == "id"}
+    names = {value for kind, value in refs if kind == "name"}
+    if not ids and not names:
+        return {}
+    rows = db.session.query(model.id, name_column).filter(
+        db.or_(model.id.in_(ids), name_column.in_(names))
+    )
+    found = {}
+    for row_id, name in rows:
+        found[("id", row_id)] = row_id
+        found[("name", name)] = row_id
+    return found
+
+
+def _rename_clashes(model, name_field, renames, results):
+    # Fails each item that renames a row to a name that another row already has, or that an earlier item in the
+    # same batch takes, so that only those items fail instead of the unique constraint failing the whole batch.
+    # 'renames' is {index: (row ID, new name)}, and the indexes of the failed items are returned.
+    name_column = getattr(model, name_field)
+    taken = dict(
+        db.session.query(name_column, model.id).filter(name_column.in_({name for _, name in renames.values()}))
+    ) if renames else {}
+    failed, seen = set(), set()
+    for index, (row_id, name) in sorted(renames.items()):
+        if taken.get(name, row_id) != row_id:
+            results[index] = _error(index, "{0} '{1}' already exists".format(name_field, name))
+        elif name in seen:
+            results[index] = _error(index, "{0} '{1}' appears more than once in this batch".format(name_field, name))
+        else:
+            seen.add(name)
+            continue
+        failed.add(index)
+    return failed
+
+
+def _task_values(item, partial=False):
+    # Checks one task item and returns the column values to write. With partial=True, which is used for
+    # updates, only the fields present in the item are checked and returned.
+    if not isinstance(item, dict):
+        raise ItemError("each task must be a JSON object")
+    values = {}
+    if not partial or "task_name" in item:
+        values["task_name"] = _text(item, "task_name", 50)
+    if not partial or "task_description" in item:
+        values["task_description"] = _text(item, "task_description")
+    if not partial or "is_urgent" in item:
+        values["is_urgent"] = _is_urgent(item)
+    if not partial or "due_date" in item:
+        values["due_date"] = _due_date(item)
+    if not partial or "category_id" in item or "category_name" in item:
+        values["category"] = _category_ref(item)
+    return values
+
+
+def _attach_categories(parsed, results):
+    # swaps each task's category reference for a real category ID, or fails the item if that category doesn't exist
+    categories = _resolve(
+        Category, Category.category_name,
+        [values["category"] for values in parsed.values() if "category" in values]
+    )
+    for index, values in list(parsed.items()):
+        if "category" not in values:
+            continue
+        ref = values.pop("category")
+        if ref not in categories:
+            results[index] = _error(index, "category {0} '{1}' does not exist".format(*ref))
+            del parsed[index]
+        else:
+            values["category_id"] = categories[ref]
+
+
+def create_tasks(items, on_duplicate="error"):
+    """Insert a batch of tasks and return one result per item.
+
+    'on_duplicate' decides what happens to a task whose name is already taken:
+    "error" fails that item, "skip" leaves the existing task alone, and
+    "update" overwrites the existing task with the new values.
+    """
+    results = [None] * len(items)
+    parsed = {}
+    for index, item in enumerate(items):
+        try:
+            parsed[index] = _task_values(item)
+        except ItemError as error:
+            results[index] = _error(index, error)
+    _attach_categories(parsed, results)
+
+    existing = dict(
+        db.session.query(Task.task_name, Task.id)
+        .filter(Task.task_name.in_({values["task_name"] for values in parsed.values()}))
+    ) if parsed else {}
+    inserts, updates, seen = [], [], set()
+    for index, values in parsed.items():
+        name = values["task_name"]
+        if name in seen:
+            results[index] = _error(index, "task_name '{0}' appears more than once in this batch".format(name))
+            continue
+        seen.add(name)
+        if name not in existing:
+            inserts.append(values)
+        elif on_duplicate == "skip":
+            results[index] = _ok(index, "skipped", existing[name])
+        elif on_duplicate == "update":
+            updates.append(dict(values, id=existing[name]))
+            results[index] = _ok(index, "updated", existing[name])
+        else:
+            results[index] = _error(index, "task_name '{0}' already exists".format(name))
+
+    # bulk_insert_mappings() sends all the rows as one executemany(), which psycopg2 turns into multi-row INSERTs
+    db.session.bulk_insert_mappings(Task, inserts)
+    _update_task_rows(updates)
+    if inserts or updates:
+        # bulk writes skip the ORM's flush events, so the task stats and the data version are updated by hand,
+        # in that order, like everywhere else (see stats.py)
+        stats.add_rows(db.session, inserts)
+        versions.bump(db.session, "task")
+    if inserts:
+        # the new IDs aren't returned by an executemany(), so we look them up by their unique names in one go
+        new_ids = dict(
+            db.session.query(Task.task_name, Task.id)
+            .filter(Task.task_name.in_([values["task_name"] for values in inserts]))
+        )
+        for index, values in parsed.items():
+            if results[index] is None:
+                results[index] = _ok(index, "created", new_ids[values["task_name"]])
+    return results
+
+
+def _update_task_rows(updates):
+    # the task stats (see stats.py) only change when a task moves to another category, or becomes (non-)urgent,
+    # so only those tasks are taken out of the totals before the update, and counted again afterwards
+    counted = [values["id"] for values in updates if "category_id" in values or "is_urgent" in values]
+    stats.remove_ids(db.session, counted)
+    db.session.bulk_update_mappings(Task, updates)
+    stats.add_ids(db.session, counted)
+
+
+def update_tasks(items):
+    """Update a batch of existing tasks, found by 'id' or 'task_name', and return one result per item."""
+    results = [None] * len(items)
+    refs, parsed = {}, {}
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ItemError("each task must be a JSON object")
+            refs[index] = _row_ref(item, "task_name")
+            if refs[index][0] == "name":
+                # when the task is found by its name, that name is the lookup key, not a new value
+                item = {key: value for key, value in item.items() if key != "task_name"}
+            parsed[index] = _task_values(item, partial=True)
+            if not parsed[index]:
+                raise ItemError("there is nothing to update")
+        except ItemError as error:
+            results[index] = _error(index, error)
+            parsed.pop(index, None)
+    _attach_categories(parsed, results)
+
+    tasks = _resolve(Task, Task.task_name, [refs[index] for index in parsed])
+    clashes = _rename_clashes(Task, "task_name", {
+        index: (tasks[refs[index]], values["task_name"])
+        for index, values in parsed.items() if refs[index] in tasks and "task_name" in values
+    }, results)
+    updates = []
+    for index, values in parsed.items():
+        if refs[index] not in tasks:
+            results[index] = _error(index, "task {0} '{1}' does not exist".format(*refs[index]))
+            continue
+        if index in clashes:
+            continue
+        updates.append(dict(values, id=tasks[refs[index]]))
+        results[index] = _ok(index, "updated", tasks[refs[index]])
+    # rows that change the same set of columns are grouped into one executemany() UPDATE
+    _update_task_rows(updates)
+    if updates:
+        versions.bump(db.session, "task")
+    return results
+
+
+def _delete(model, name_field, items, changed_tables):
+    results = [None] * len(items)
+    refs = {}
+    for index, item in enumerate(items):
+        try:
+            refs[index] = _row_ref(item, name_field)
+        except ItemError as error:
+            results[index] = _error(index, error)
+    found = _resolve(model, getattr(model, name_field), refs.values())
+    ids = set()
+    for index, ref in refs.items():
+        if ref not in found:
+            results[index] = _error(index, "{0} {1} '{2}' does not exist".format(model.__tablename__, *ref))
+        else:
+            ids.add(found[ref])
+            results[index] = _ok(index, "deleted", found[ref])
+    if ids:
+        if model is Task:
+            # deleted categories take their task stats with them, but single tasks have to be taken out of the totals
+            stats.remove_ids(db.session, ids)
+        model.query.filter(model.id.in_(ids)).delete(synchronize_session=False)
+        versions.bump(db.session, *changed_tables)
+    return results
+
+
+def delete_tasks(items):
+    """Delete a batch of tasks, found by 'id' or 'task_name', with a single DELETE."""
+    return _delete(Task, "task_name", items, ["task"])
+
+
+def _category_values(item, partial=False):
+    if not isinstance(item, dict):
+        raise ItemError("each category must be a JSON object")
+    values = {}
+    if not partial or "category_name" in item:
+        values["category_name"] = _text(item, "category_name", 25)
+    return values
+
+
+def create_categories(items):
+    """Insert a batch of categories and return one result per item."""
+    results = [None] * len(items)
+    parsed = {}
+    for index, item in enumerate(items):
+        try:
+            parsed[index] = _category_values(item)
+        except ItemError as error:
+            results[index] = _error(index, error)
+    names = [values["category_name"] for values in parsed.values()]
+    existing = set(
+        name for name, in db.session.query(Category.category_name).filter(Category.category_name.in_(names))
+    ) if names else set()
+    inserts, seen = [], set()
+    for index, values in parsed.items():
+        name = values["category_name"]
+        if name in existing:
+            results[index] = _error(index, "category_name '{0}' already exists".format(name))
+        elif name in seen:
+            results[index] = _error(index, "category_name '{0}' appears more than once in this batch".format(name))
+        else:
+            seen.add(name)
+            inserts.append(values)
+    db.session.bulk_insert_mappings(Category, inserts)
+    if inserts:
+        new_ids = dict(
+            db.session.query(Category.category_name, Category.id).filter(Category.category_name.in_(seen))
+        )
+        stats.add_categories(db.session, new_ids.values())
+        versions.bump(db.session, "category")
+        for index, values in parsed.items():
+            if results[index] is None:
+                results[index] = _ok(index, "created", new_ids[values["category_name"]])
+    return results
+
+
+def update_categories(items):
+    """Rename a batch of categories, found by 'id', and return one result per item."""
+    results = [None] * len(items)
+    refs, parsed = {}, {}
+    for index, item in enumerate(items):
+        try:
+            if not isinstance(item, dict):
+                raise ItemError("each category must be a JSON object")
+            refs[index] = _row_ref(item, "category_name")
+            if refs[index][0] == "name":
+                # the name is the only column a category has, so it can't be both the lookup key and the new value
+                raise ItemError("'id' is required to rename a category")
+            parsed[index] = _category_values(item, partial=True)
+            if not parsed[index]:
+                raise ItemError("there is nothing to update")
+        except ItemError as error:
+            results[index] = _error(index, error)
+            parsed.pop(index, None)
+    categories = _resolve(Category, Category.category_name, [refs[index] for index in parsed])
+    clashes = _rename_clashes(Category, "category_name", {
+        index: (categories[refs[index]], values["category_name"])
+        for index, values in parsed.items() if refs[index] in categories
+    }, results)
+    updates = []
+    for index, values in parsed.items():
+        if refs[index] not in categories:
+            results[index] = _error(index, "category {0} '{1}' does not exist".format(*refs[index]))
+            continue
+        if index in clashes:
+            continue
+        updates.append(dict(values, id=categories[refs[index]]))
+        results[index] = _ok(index, "updated", categories[refs[index]])
+    db.session.bulk_update_mappings(Category, updates)
+    if updates:
+        versions.bump(db.session, "category")
+    return results
+
+
+def delete_categories(items):
+    """Delete a batch of categories, found by 'id' or 'category_name', along with all of their tasks."""
+    # the tasks go too, through the ondelete="CASCADE" on their foreign key, inside the database itself
+    return _delete(Category, "category_name", items, ["category", "task"])
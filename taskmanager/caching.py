@@ -0,0 +1,69 @@
+# A small in-process cache for the list of categories.
+# The add_task, edit_task and categories pages all need every category, sorted by name, but categories hardly
+# ever change. So the list is kept in memory for a while (CATEGORY_CACHE_TTL seconds), in a cache that can
+# never grow past CATEGORY_CACHE_SIZE entries. It is dropped as soon as a category is added, edited or deleted:
+# by the category routes themselves, and by the after_commit listener below for any other write (like the API).
+# Each gunicorn worker has its own copy, and a cache hit doesn't ask the database anything at all, so a change
+# committed by another worker only shows up here once the entry expires, CATEGORY_CACHE_TTL seconds at most.
+# The exception is the categories page, whose @conditional (see versions.py) has already read the category data
+# version for its ETag: every entry remembers the version it was built from, and it's rebuilt when that differs.
+# A category can also change while a miss is still loading the list, after its SELECT but before the list is stored.
+# Storing it then would keep the old list for a whole TTL, so every invalidation adds one to _generation,
+# and a miss only stores its list if _generation is still what it was when the miss began.
+from threading import Lock
+from cachetools import TTLCache
+from flask import current_app, g, has_request_context
+from taskmanager import db
+from taskmanager.models import Category
+
+_lock = Lock()
+_cache = None
+_generation = 0
+
+
+def _get_cache():
+    # created on first use, so that the size and TTL can come from the app's config
+    global _cache
+    if _cache is None:
+        _cache = TTLCache(
+            maxsize=current_app.config["CATEGORY_CACHE_SIZE"],
+            ttl=current_app.config["CATEGORY_CACHE_TTL"]
+        )
+    return _cache
+
+
+def get_categories():
+    """Return every category as (id, category_name) rows, sorted by name."""
+    # None when this request hasn't read the version, which is trusted to be the same as the entry's
+    version = g.get("data_versions", {}).get("category") if has_request_context() else None
+    with _lock:
+        cache = _get_cache()
+        entry = cache.get("categories")
+        generation = _generation
+    if entry is not None and (version is None or entry[0] == version):
+        return entry[1]
+    # plain rows rather than Category objects, which would be tied to the database session that loaded them
+    categories = tuple(
+        db.session.query(Category.id, Category.category_name).order_by(Category.category_name)
+    )
+    with _lock:
+        # otherwise the categories were invalidated while we read them, and this list may already be out of date
+        if _generation == generation:
+            cache["categories"] = (version, categories)
+    return categories
+
+
+def invalidate_categories():
+    """Drop the cached categories, so the next request loads them again."""
+    global _generation
+    with _lock:
+        _generation += 1
+        if _cache is not None:
+            _cache.clear()
+
+
+@db.event.listens_for(db.session, "after_commit")
+def invalidate_after_commit(session):
+    # versions.bump() records which tables each transaction changed, so any committed category change clears the cache
+    if "category" in session.info.get("changed_tables", ()):
+        invalidate_categories()
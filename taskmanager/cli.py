@@ -0,0 +1,226 @@
+# Custom "flask ..." commands for looking after the database and the templates, next to Flask-Migrate's "flask db ..." ones.
+# Each command is a plain click command, run inside an application context (@with_appcontext), and init_app()
+# at the bottom adds them all to the app that create_app() builds (see __init__.py).
+from datetime import date
+import json
+import os
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+from taskmanager import db, deletion, export, importer, stats, templating
+from taskmanager.models import Category, Task
+
+
+class Explain(Executable, ClauseElement):
+    # A tiny SQL construct that wraps any SELECT in "EXPLAIN", so the bound parameters (like dates)
+    # still go through SQLAlchemy as normal, instead of having to be pasted into the SQL string.
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def compile_explain(element, compiler, **kw):
+    # SQLite and PostgreSQL have a different spelling for "show me the query plan"
+    prefix = "EXPLAIN QUERY PLAN " if compiler.dialect.name == "sqlite" else "EXPLAIN "
+    return prefix + compiler.process(element.statement, **kw)
+
+
+def hot_queries():
+    # The queries the app runs the most, along with the index each one is expected to use.
+    # They are built with the same options as in routes.py, so the plans match what really runs.
+    first_day = date(2000, 1, 1)
+    return [
+        (
+            "home page (tasks ordered by due date)",
+            Task.query.options(db.joinedload(Task.category, innerjoin=True))
+            .filter(db.tuple_(Task.due_date, Task.id) > db.tuple_(first_day, 0))
+            .order_by(Task.due_date, Task.id).limit(26),
+            "ix_task_due_date_id"
+        ),
+        (
+            "tasks of a category (delete cascade)",
+            db.session.query(Task.id).filter(Task.category_id == 1),
+            "ix_task_category_id_due_date_id"
+        ),
+        (
+            "urgent tasks ordered by due date",
+            Task.query.filter(Task.is_urgent == True).order_by(Task.due_date, Task.id).limit(26), # noqa
+            "ix_task_urgent_due_date_id"
+        ),
+        (
+            "dashboard (tasks due by the end of the week, per category)",
+            stats.due_query(first_day),
+            "ix_task_due_date_category_id"
+        ),
+    ]
+
+
+@click.command("check-indexes")
+@with_appcontext
+def check_indexes():
+    """Run EXPLAIN on the hot queries and fail if any of them isn't using its index."""
+    dialect = db.engine.dialect.name
+    failures = []
+    with db.engine.connect() as connection:
+        with connection.begin():
+            if dialect == "postgresql":
+                # on a small table, a sequential scan is genuinely cheaper, so PostgreSQL would ignore our indexes.
+                # Discouraging it (only for this transaction) shows which index the planner picks once the table is large.
+                connection.exec_driver_sql("SET LOCAL enable_seqscan = off")
+            for name, query, index in hot_queries():
+                rows = connection.execute(Explain(query.statement)).fetchall()
+                plan = "\n".join(" ".join(str(value) for value in row) for row in rows)
+                if index in plan:
+                    click.echo("ok      {0}: uses {1}".format(name, index))
+                else:
+                    click.echo("MISSING {0}: expected {1}\n{2}".format(name, index, plan))
+                    failures.append(name)
+    if failures:
+        raise click.ClickException(
+            "{0} of the hot queries on {1} aren't using their index, "
+            "have you run 'flask db upgrade'?".format(len(failures), dialect)
+        )
+
+# The "check-indexes" command is how we make sure the indexes in models.py (and in the migrations) keep
+# matching how the app actually reads its data. Run it with "flask check-indexes" against SQLite or PostgreSQL,
+# and it exits with an error if any hot query would fall back to scanning the whole task table.
+
+
+@click.command("export-tasks")
+@with_appcontext
+@click.option("--format", "output_format", type=click.Choice(sorted(export.FORMATS)), default="csv", show_default=True)
+@click.option("--output", "-o", default="-", help="File to write to, '-' for the terminal.", show_default=True)
+@click.option("--category", help="Only export the tasks of this category name.")
+@click.option("--urgent/--not-urgent", default=None, help="Only export urgent (or non-urgent) tasks.")
+@click.option("--due-from", type=click.DateTime(formats=["%Y-%m-%d"]), help="Earliest due date, YYYY-MM-DD.")
+@click.option("--due-to", type=click.DateTime(formats=["%Y-%m-%d"]), help="Latest due date, YYYY-MM-DD.")
+@click.option("--batch-size", default=export.BATCH_SIZE, show_default=True, help="Rows fetched per round trip.")
+def export_tasks(output_format, output, category, urgent, due_from, due_to, batch_size):
+    """Stream every task, with its category name, as CSV or NDJSON."""
+    chunks = export.export_tasks(
+        output_format,
+        category_name=category,
+        urgent=urgent,
+        due_from=due_from.date() if due_from else None,
+        due_to=due_to.date() if due_to else None,
+        batch_size=batch_size
+    )
+    # the file is opened in binary mode, so the line endings the csv module writes are kept exactly as they are
+    with click.open_file(output, "wb") as file:
+        for chunk in chunks:
+            file.write(chunk.encode("utf-8"))
+
+
+def _save_import_state(state_file, rows):
+    # written to a temporary file first and then renamed, so a crash can never leave a half-written state file
+    with open(state_file + ".tmp", "w") as file:
+        json.dump({"rows": rows}, file)
+    os.replace(state_file + ".tmp", state_file)
+
+
+@click.command("import-tasks")
+@with_appcontext
+@click.argument("source", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "input_format", type=click.Choice(importer.FORMATS),
+              help="File format, guessed from the file extension when left out.")
+@click.option("--chunk-size", default=importer.CHUNK_SIZE, show_default=True, help="Rows written per commit.")
+@click.option("--on-duplicate", type=click.Choice(["skip", "update", "error"]), default="skip", show_default=True,
+              help="What to do with tasks whose name already exists.")
+@click.option("--resume/--restart", default=True, show_default=True,
+              help="Carry on from the last committed chunk of an interrupted import of the same file.")
+def import_tasks(source, input_format, chunk_size, on_duplicate, resume):
+    """Import tasks from a CSV or NDJSON file, one committed chunk at a time."""
+    input_format = input_format or os.path.splitext(source)[1].lstrip(".").lower()
+    if input_format not in importer.FORMATS:
+        raise click.BadParameter("can't tell the format of {0}, use --format".format(source))
+
+    # the number of committed rows is kept next to the file, and removed again once the import finishes
+    state_file = source + ".import-state"
+    start_row = 0
+    if resume and os.path.exists(state_file):
+        with open(state_file) as file:
+            start_row = json.load(file)["rows"]
+        click.echo("Resuming after row {0}.".format(start_row))
+
+    def report(progress):
+        _save_import_state(state_file, progress.rows)
+        for row, error in progress.chunk_errors:
+            click.echo("row {0}: {1}".format(row, error), err=True)
+        click.echo("{0} rows done, {1:.0f} rows/s".format(progress.rows, progress.rows_per_second))
+
+    with open(source, encoding="utf-8", newline="") as file:
+        progress = importer.import_tasks(
+            file, input_format, chunk_size=chunk_size, on_duplicate=on_duplicate,
+            start_row=start_row, on_chunk=report
+        )
+    click.echo(
+        "Imported {0} rows in total: {created} created, {updated} updated, {skipped} skipped, {error} errors, "
+        "{1:.0f} rows/s.".format(progress.rows, progress.rows_per_second, **progress.counts)
+    )
+    if os.path.exists(state_file):
+        os.remove(state_file)
+
+
+@click.command("delete-category")
+@with_appcontext
+@click.argument("category_id", type=int)
+@click.option("--batch-size", type=int, help="Tasks deleted per commit, CATEGORY_DELETE_BATCH_SIZE by default.")
+def delete_category(category_id, batch_size):
+    """Delete a category and its tasks in small batches, showing the progress."""
+    category = Category.query.get(category_id)
+    if category is None:
+        raise click.ClickException("There is no category with the ID {0}.".format(category_id))
+    total = deletion.remaining_tasks(category_id)
+    click.echo("Deleting '{0}' and its {1} tasks.".format(category.category_name, total))
+    with click.progressbar(length=total, label="Deleting tasks") as bar:
+        done = {"tasks": 0}
+
+        def report(deleted):
+            bar.update(deleted - done["tasks"])
+            done["tasks"] = deleted
+        deletion.delete_category_in_batches(
+            category_id, batch_size or current_app.config["CATEGORY_DELETE_BATCH_SIZE"], on_batch=report
+        )
+    click.echo("Done.")
+
+
+@click.command("rebuild-stats")
+@with_appcontext
+def rebuild_stats():
+    """Count every category's tasks again, and fix the dashboard's stored totals."""
+    for category_id, stored, counted in stats.drift():
+        click.echo("category {0}: stored {1}, counted {2}".format(
+            category_id, "nothing" if stored is None else "{0} tasks, {1} urgent".format(*stored),
+            "{0} tasks, {1} urgent".format(*counted)
+        ))
+    stats.rebuild()
+    db.session.commit()
+    click.echo("Rebuilt the task stats.")
+
+# The totals in the task_stats table (see stats.py) are kept up to date by every change, so this is only needed
+# after the database was changed some other way, like by hand. It lists the categories that were wrong, then fixes them.
+
+
+@click.command("precompile-templates")
+@with_appcontext
+def precompile_templates():
+    """Compile every template into the Jinja bytecode cache, so the workers don't have to."""
+    folder = current_app.config["JINJA_BYTECODE_CACHE"]
+    if current_app.jinja_env.bytecode_cache is None:
+        raise click.ClickException("JINJA_BYTECODE_CACHE is switched off, or its folder can't be written to.")
+    names = templating.precompile(current_app)
+    click.echo("Compiled {0} templates into {1}.".format(len(names), folder))
+
+# Run it whenever the templates change, which on Heroku means on every build (bin/post_compile does that).
+# Templates that are already in the cache, unchanged, are only loaded, so running it again costs next to nothing.
+
+
+def init_app(app):
+    for command in (
+        check_indexes, export_tasks, import_tasks, delete_category, rebuild_stats, precompile_templates
+    ):
+        app.cli.add_command(command)
@@ -0,0 +1,105 @@
+# Database engine settings and read-replica routing.
+# Flask-SQLAlchemy normally sends every query to the one database in SQLALCHEMY_DATABASE_URI.
+# When DB_REPLICA_URL is set as well, it becomes an extra bind called "replica", and the views marked with
+# @use_replica send their reads there on GET requests, which takes that load off the primary database.
+# Everything else, and anything that writes, still goes to the primary.
+# To try it out locally, point DB_URL and DB_REPLICA_URL at two SQLite files, run "flask db upgrade",
+# and copy the first file over the second one. Anything added after that only shows up on the read pages
+# for a few seconds after your own change (see stick_to_primary below), until the file is copied again.
+import os
+import time
+from functools import wraps
+from flask import current_app, g, has_request_context, request, session as cookie_session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import event, orm
+
+REPLICA = "replica"
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).lower() in ("1", "true", "yes")
+
+
+def engine_options(uri):
+    """Build SQLALCHEMY_ENGINE_OPTIONS for 'uri' from the DB_POOL_* environment variables."""
+    options = {
+        # checks each connection is still alive before handing it out, since Heroku (and PgBouncer) close idle ones
+        "pool_pre_ping": _env_flag("DB_POOL_PRE_PING", "True"),
+        # replaces connections after this many seconds, before the server side times them out
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+    }
+    if uri and not uri.startswith("sqlite"):
+        # SQLite files don't use a connection pool at all (see Flask-SQLAlchemy's apply_driver_hacks),
+        # and without any URI (see create_app) there's no engine to configure yet
+        options["pool_size"] = int(os.environ.get("DB_POOL_SIZE", 5))
+        options["max_overflow"] = int(os.environ.get("DB_MAX_OVERFLOW", 10))
+        options["pool_timeout"] = int(os.environ.get("DB_POOL_TIMEOUT", 30))
+    return options
+
+
+def _replica_allowed():
+    if not has_request_context() or not g.get("use_replica"):
+        return False
+    # right after someone changes something, they read from the primary for a few seconds,
+    # so they see their own change even if the replica hasn't caught up yet
+    return cookie_session.get("db_primary_until", 0) < time.time()
+
+
+def _has_replica(app):
+    return REPLICA in (app.config["SQLALCHEMY_BINDS"] or {})
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        # a session that is in the middle of writing always stays on the primary
+        if (
+            _has_replica(self.app)
+            and not self._flushing
+            and not (self.new or self.dirty or self.deleted)
+            and _replica_allowed()
+        ):
+            return self.db.get_engine(self.app, bind=REPLICA)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    # Flask-SQLAlchemy, with sessions that know about the read replica
+    def create_session(self, options):
+        factory = orm.sessionmaker(class_=RoutingSession, db=self, **options)
+        # sessionmaker() makes its own subclass of RoutingSession, so the listener goes on that
+        event.listen(factory, "after_commit", stick_to_primary)
+        return factory
+
+
+def lock_for_update(query):
+    """Return 'query' with FOR UPDATE, so the rows it reads stay as they are until the transaction ends.
+
+    SQLite ignores FOR UPDATE, so there the whole database is locked for writing first (BEGIN IMMEDIATE),
+    which makes any other writer wait in the same way, and the rows are then read as they are after its commit.
+    """
+    connection = query.session.connection()
+    # once a SQLite transaction has begun, it has already written something, and so holds the write lock
+    if connection.dialect.name == "sqlite" and not connection.connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
+    return query.with_for_update()
+
+
+def use_replica(view):
+    """Let a view read from the replica database when it's answering a GET request."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method in ("GET", "HEAD"):
+            g.use_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def stick_to_primary(session):
+    # After a commit that changed something (see versions.bump), the next few requests from the same browser
+    # read from the primary, for DB_REPLICA_STICKY_SECONDS, so the replica has time to catch up.
+    if session.info.get("changed_tables") and has_request_context() and _has_replica(current_app):
+        cookie_session["db_primary_until"] = time.time() + current_app.config["DB_REPLICA_STICKY_SECONDS"]
@@ -0,0 +1,88 @@
+# Deleting very large categories in bounded batches.
+# Normally, deleting a category is a single DELETE, and the database removes its tasks through ondelete="CASCADE".
+# For a category with tens of thousands of tasks, though, that one statement locks every one of those rows and
+# builds one huge transaction, while the request waits for it. Above CATEGORY_DELETE_BACKGROUND_THRESHOLD tasks,
+# delete_category() in routes.py hands the work to a background thread instead, which deletes the tasks
+# CATEGORY_DELETE_BATCH_SIZE at a time, committing after each batch, and only then deletes the category itself.
+# Progress is worked out from the tasks still left in the database, so any worker can report it.
+# The background thread lives inside a web worker, so it stops halfway whenever that worker does: when gunicorn
+# recycles it (max_requests, see gunicorn.conf.py), or on a restart or deploy. Nothing records that the delete was
+# asked for, so the progress page is what carries it on: every time it's shown while the category still exists,
+# it starts the delete again, unless this worker is already running it. If another worker is still running it too,
+# both delete the same batches, which is safe (see stats.py), just wasted work. Nothing restarts a delete that
+# nobody is watching, though, so "flask delete-category" is still the way to finish one for sure.
+import threading
+from flask import current_app
+from taskmanager import db, stats, versions
+from taskmanager.caching import invalidate_categories
+from taskmanager.models import Category, Task
+
+_running = set()
+_running_lock = threading.Lock()
+
+
+def has_more_tasks_than(category_id, count):
+    # "is there a task after the first 'count'?" stops reading at count + 1 rows, where COUNT(*) would read them all
+    return db.session.query(Task.id).filter(Task.category_id == category_id).offset(count).limit(1).first() is not None
+
+
+def remaining_tasks(category_id):
+    return db.session.query(db.func.count(Task.id)).filter(Task.category_id == category_id).scalar()
+
+
+def delete_category_in_batches(category_id, batch_size, on_batch=None):
+    """Delete a category's tasks 'batch_size' at a time, committing each batch, then the category itself.
+
+    'on_batch', if given, is called with the number of tasks deleted so far after every batch.
+    Running it again after an interruption simply carries on with whatever is left.
+    """
+    deleted = 0
+    while True:
+        ids = [task_id for task_id, in (
+            db.session.query(Task.id).filter(Task.category_id == category_id).limit(batch_size)
+        )]
+        if not ids:
+            break
+        stats.remove_ids(db.session, ids)
+        Task.query.filter(Task.id.in_(ids)).delete(synchronize_session=False)
+        versions.bump(db.session, "task")
+        db.session.commit()
+        deleted += len(ids)
+        if on_batch is not None:
+            on_batch(deleted)
+    category = Category.query.get(category_id)
+    if category is not None:
+        db.session.delete(category)
+        db.session.commit()
+    invalidate_categories()
+    return deleted
+
+
+def _delete_in_background(app, category_id, batch_size):
+    with app.app_context():
+        try:
+            deleted = delete_category_in_batches(category_id, batch_size)
+            app.logger.info("Deleted category %s and its %s tasks in the background", category_id, deleted)
+        except Exception:
+            db.session.rollback()
+            app.logger.exception("Deleting category %s in the background failed", category_id)
+        finally:
+            db.session.remove()
+            with _running_lock:
+                _running.discard(category_id)
+
+
+def start_background_delete(category_id):
+    """Start deleting a category in a background thread, unless this worker is already doing so."""
+    with _running_lock:
+        if category_id in _running:
+            return
+        _running.add(category_id)
+    app = current_app._get_current_object()
+    thread = threading.Thread(
+        target=_delete_in_background,
+        args=(app, category_id, app.config["CATEGORY_DELETE_BATCH_SIZE"]),
+        name="delete-category-{0}".format(category_id),
+        daemon=True
+    )
+    thread.start()
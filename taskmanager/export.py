@@ -0,0 +1,85 @@
+# Streaming export of the whole task table, joined with each task's category name, as CSV or NDJSON.
+# The rows are read through a server-side cursor with yield_per(), and written out in small chunks by a generator,
+# so the export uses the same (small) amount of memory whether the table holds a hundred tasks or millions.
+# It's used by the /api/v1/tasks/export endpoint in api.py and by the "flask export-tasks" command in cli.py.
+import csv
+import io
+import json
+from taskmanager import db
+from taskmanager.models import Category, Task
+
+FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+
+COLUMNS = ("id", "task_name", "task_description", "is_urgent", "due_date", "category_name")
+
+# how many rows each round trip to the database fetches, and roughly how many bytes each chunk of output holds
+BATCH_SIZE = 1000
+CHUNK_SIZE = 64 * 1024
+
+
+def task_rows(category_id=None, category_name=None, urgent=None, due_from=None, due_to=None, batch_size=BATCH_SIZE):
+    # All of the filters become part of the WHERE clause, so the database does the filtering, not Python.
+    query = (
+        db.session.query(
+            Task.id, Task.task_name, Task.task_description, Task.is_urgent, Task.due_date,
+            Category.category_name
+        )
+        .join(Category, Task.category_id == Category.id)
+    )
+    if category_id is not None:
+        query = query.filter(Task.category_id == category_id)
+    if category_name is not None:
+        query = query.filter(Category.category_name == category_name)
+    if urgent is not None:
+        query = query.filter(Task.is_urgent == urgent)
+    if due_from is not None:
+        query = query.filter(Task.due_date >= due_from)
+    if due_to is not None:
+        query = query.filter(Task.due_date <= due_to)
+    # yield_per() turns on stream_results, which is a server-side (named) cursor on PostgreSQL
+    return query.order_by(Task.id).yield_per(batch_size)
+
+
+def _csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for row in rows:
+        writer.writerow((row.id, row.task_name, row.task_description, row.is_urgent,
+                         row.due_date.isoformat(), row.category_name))
+        if buffer.tell() >= CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _ndjson_chunks(rows):
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps({
+            "id": row.id,
+            "task_name": row.task_name,
+            "task_description": row.task_description,
+            "is_urgent": row.is_urgent,
+            "due_date": row.due_date.isoformat(),
+            "category_name": row.category_name,
+        }) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield "".join(lines)
+            lines, size = [], 0
+    yield "".join(lines)
+
+
+def export_tasks(output_format="csv", **filters):
+    """Yield the tasks matching 'filters' (see task_rows) as chunks of CSV or NDJSON text."""
+    rows = task_rows(**filters)
+    if output_format == "ndjson":
+        return _ndjson_chunks(rows)
+    return _csv_chunks(rows)
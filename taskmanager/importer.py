@@ -0,0 +1,101 @@
+# Chunked bulk import of tasks from CSV or NDJSON files, such as the ones export.py writes.
+# The file is read as a stream, a fixed number of rows at a time. Each chunk goes through bulk.create_tasks(),
+# which resolves all of the chunk's category names with one query and writes the rows with bulk inserts,
+# and is then committed on its own. That way a failure only loses the chunk in progress, and an interrupted
+# import can carry on from the last committed row, instead of starting again from the top.
+# It's used by the "flask import-tasks" command in cli.py and by the /api/v1/tasks/import endpoint in api.py.
+import csv
+import json
+import time
+from itertools import islice
+from taskmanager import bulk, db
+
+FORMATS = ("csv", "ndjson")
+
+CHUNK_SIZE = 1000
+
+# only this many errors are kept for the final report, a file full of bad rows shouldn't fill up the memory
+MAX_ERRORS = 1000
+
+TRUE_VALUES = ("1", "true", "yes", "y")
+FALSE_VALUES = ("", "0", "false", "no", "n")
+
+
+def _csv_items(lines):
+    for row in csv.DictReader(lines):
+        # everything in a CSV file is text, so the urgent flag has to be turned back into a real boolean
+        urgent = (row.get("is_urgent") or "").strip().lower()
+        if urgent in TRUE_VALUES:
+            row["is_urgent"] = True
+        elif urgent in FALSE_VALUES:
+            row["is_urgent"] = False
+        yield row
+
+
+def _ndjson_items(lines):
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            # handed to bulk.create_tasks() as is, so it's reported as an error for this row only
+            yield line
+
+
+def read_items(lines, input_format="csv"):
+    """Yield one task item (a dictionary) per row of a CSV or NDJSON text stream."""
+    if input_format == "ndjson":
+        return _ndjson_items(lines)
+    return _csv_items(lines)
+
+
+class ImportProgress:
+    # Running totals for an import, updated after every committed chunk.
+    def __init__(self, start_row=0):
+        self.start_row = start_row
+        self.rows = start_row
+        self.counts = {"created": 0, "updated": 0, "skipped": 0, "error": 0}
+        self.errors = []
+        self.chunk_errors = []
+        self.started = time.perf_counter()
+
+    @property
+    def rows_per_second(self):
+        elapsed = time.perf_counter() - self.started
+        return (self.rows - self.start_row) / elapsed if elapsed else 0.0
+
+
+def import_tasks(lines, input_format="csv", chunk_size=CHUNK_SIZE, on_duplicate="skip", start_row=0, on_chunk=None):
+    """Import every task from 'lines', committing one chunk at a time.
+
+    The first 'start_row' rows are skipped, which is how an interrupted import
+    is resumed. 'on_chunk', if given, is called with the ImportProgress after
+    each commit, once the rows up to progress.rows are safely in the database.
+    """
+    items = read_items(lines, input_format)
+    progress = ImportProgress(start_row)
+    # the rows before start_row were committed by an earlier run, so they're read but not imported again
+    for _ in islice(items, start_row):
+        pass
+    while True:
+        chunk = list(islice(items, chunk_size))
+        if not chunk:
+            break
+        try:
+            results = bulk.create_tasks(chunk, on_duplicate=on_duplicate)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        progress.chunk_errors = []
+        for result in results:
+            progress.counts[result["status"]] += 1
+            if result["status"] == "error":
+                # row numbers count from 1, and don't include the header line of a CSV file
+                progress.chunk_errors.append((progress.rows + result["index"] + 1, result["error"]))
+        progress.errors.extend(progress.chunk_errors[:MAX_ERRORS - len(progress.errors)])
+        progress.rows += len(chunk)
+        if on_chunk is not None:
+            on_chunk(progress)
+    return progress
@@ -0,0 +1,165 @@
+# Per-request timings, and a Prometheus /metrics endpoint.
+# For every request we count the SQL statements and the time spent running them (from SQLAlchemy's cursor events),
+# and the time spent rendering the template (from our own Jinja template class, below). The split is sent back in a
+# "Server-Timing" header, which the browser's developer tools show in the Network tab:
+#   Server-Timing: db;dur=3.1;desc="4 queries", render;dur=1.2, total;dur=6.0
+# Queries that run while the template is rendering, like a lazy {{ task.category }}, count as "db", not "render".
+# A request is written to the "taskmanager.instrumentation" log, as one line of JSON, when it runs the same statement
+# N_PLUS_ONE_THRESHOLD times or more (usually a relationship being loaded one row at a time, the "N+1" problem),
+# or when one of its statements takes longer than SLOW_QUERY_MS. Nothing is logged for ordinary requests.
+# Each statement only costs two clock readings and a dictionary update, so all of this can stay switched on.
+#
+# The numbers on /metrics are kept by prometheus_client. Under gunicorn each worker process counts its own requests,
+# and any worker may answer the scrape, so gunicorn.conf.py sets PROMETHEUS_MULTIPROC_DIR: every worker then keeps its
+# numbers in a small memory-mapped file in that folder, and /metrics adds all the files up, so the totals cover every
+# worker, including the ones gunicorn has already recycled. The series have no worker or pid label, so a recycled
+# worker doesn't leave series behind. The folder gets one more file for each new worker, and is emptied each time
+# gunicorn starts (see gunicorn.conf.py), which on Heroku is at least once a day. Without PROMETHEUS_MULTIPROC_DIR
+# (run.py, the tests) the numbers are simply kept in memory, which is right for a single process.
+import json
+import logging
+import os
+import time
+from flask import Blueprint, current_app, g, has_request_context, request
+from jinja2 import Template
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client import multiprocess
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+metrics = Blueprint("metrics", __name__)
+
+# in seconds, from a quick cache hit up to a request that is about to time out
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_SECONDS = Histogram(
+    "taskmanager_request_duration_seconds", "Time taken to answer each request.", ("route", "method", "status"),
+    buckets=BUCKETS
+)
+DB_SECONDS = Histogram(
+    "taskmanager_request_db_seconds", "Time spent running SQL statements, per request.", ("route", "method"),
+    buckets=BUCKETS
+)
+DB_QUERIES = Counter("taskmanager_db_queries_total", "SQL statements run while answering requests.", ("route",))
+N_PLUS_ONE = Counter(
+    "taskmanager_n_plus_one_total", "Requests that ran the same statement N_PLUS_ONE_THRESHOLD times or more.", ("route",)
+)
+SLOW_QUERIES = Counter("taskmanager_slow_queries_total", "Statements slower than SLOW_QUERY_MS.", ("route",))
+
+
+class RequestTimings:
+    # everything measured during one request, kept on flask.g
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.statements = {}
+        self.slow = []
+
+
+class TimedTemplate(Template):
+    # Jinja calls render() once for the page itself (the templates it extends or includes are part of that call),
+    # so timing it here gives the whole time spent in the template, without needing Flask's signals (and blinker).
+    def render(self, *args, **kwargs):
+        timings = g.get("timings") if has_request_context() else None
+        if timings is None:
+            return super().render(*args, **kwargs)
+        started = time.perf_counter()
+        db_time = timings.db_time
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            # the queries run by lazy loads inside the template have already been added to db_time
+            timings.render_time += time.perf_counter() - started - (timings.db_time - db_time)
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context() and "timings" in g:
+        conn.info["query_started"] = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.pop("query_started", None)
+    if started is None or not has_request_context() or "timings" not in g:
+        return
+    elapsed = time.perf_counter() - started
+    timings = g.timings
+    timings.queries += 1
+    timings.db_time += elapsed
+    # the statement text still has its placeholders, so loading 25 categories one by one is 25 times the same text
+    timings.statements[statement] = timings.statements.get(statement, 0) + 1
+    if elapsed * 1000 >= current_app.config["SLOW_QUERY_MS"]:
+        timings.slow.append({"statement": statement, "ms": round(elapsed * 1000, 1)})
+
+
+def _route():
+    # the URL rule ("/edit_task/<int:task_id>") rather than the URL itself, so every task shares one series
+    return request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+
+
+def start_request():
+    g.timings = RequestTimings()
+
+
+def finish_request(response):
+    timings = g.pop("timings", None)
+    if timings is None:
+        return response
+    total = time.perf_counter() - timings.started
+    response.headers["Server-Timing"] = 'db;dur={0:.1f};desc="{1} queries", render;dur={2:.1f}, total;dur={3:.1f}'.format(
+        timings.db_time * 1000, timings.queries, timings.render_time * 1000, total * 1000
+    )
+
+    route = _route()
+    REQUEST_SECONDS.labels(route, request.method, response.status_code).observe(total)
+    DB_SECONDS.labels(route, request.method).observe(timings.db_time)
+    DB_QUERIES.labels(route).inc(timings.queries)
+    threshold = current_app.config["N_PLUS_ONE_THRESHOLD"]
+    repeated = [
+        {"statement": statement, "count": count}
+        for statement, count in timings.statements.items() if count >= threshold
+    ]
+    if repeated:
+        N_PLUS_ONE.labels(route).inc()
+    if timings.slow:
+        SLOW_QUERIES.labels(route).inc(len(timings.slow))
+    if repeated or timings.slow:
+        logger.warning(json.dumps({
+            "event": "slow_request" if timings.slow else "n_plus_one",
+            "method": request.method,
+            "route": route,
+            "path": request.path,
+            "status": response.status_code,
+            "total_ms": round(total * 1000, 1),
+            "db_ms": round(timings.db_time * 1000, 1),
+            "render_ms": round(timings.render_time * 1000, 1),
+            "queries": timings.queries,
+            "repeated": repeated,
+            "slow": timings.slow,
+        }))
+    return response
+
+
+@metrics.route("/metrics")
+def prometheus_metrics():
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        # adds up the files every worker, running or already gone, has written its numbers to
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return current_app.response_class(generate_latest(registry), headers={"Content-Type": CONTENT_TYPE_LATEST})
+
+
+def init_app(app):
+    if not app.config["INSTRUMENTATION"]:
+        return
+    app.jinja_env.template_class = TimedTemplate
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.register_blueprint(metrics)
@@ -0,0 +1,47 @@
+"""create category and task tables
+
+This is the schema that db.create_all() used to build. A database that was
+created that way already has these tables, so mark it as being at this
+revision with "flask db stamp 3bb726788f6b" before running "flask db upgrade".
+
+Revision ID: 3bb726788f6b
+Revises: 
+Create Date: 2026-10-18 09:12:40.118263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3bb726788f6b'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'category',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('category_name', sa.String(length=25), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('category_name')
+    )
+    op.create_table(
+        'task',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('task_name', sa.String(length=50), nullable=False),
+        sa.Column('task_description', sa.Text(), nullable=False),
+        sa.Column('is_urgent', sa.Boolean(), nullable=False),
+        sa.Column('due_date', sa.Date(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['category_id'], ['category.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('task_name')
+    )
+
+
+def downgrade():
+    op.drop_table('task')
+    op.drop_table('category')
@@ -0,0 +1,47 @@
+"""add task indexes
+
+One index for each way the app reads tasks: (due_date, id) for the paginated
+home page, (category_id, due_date, id) for finding the tasks of a category,
+and a partial (due_date, id) index that only holds the urgent tasks.
+On PostgreSQL they are built CONCURRENTLY, so writes to an existing task
+table aren't blocked while the indexes are created.
+
+Revision ID: 4c3344dc038a
+Revises: 3bb726788f6b
+Create Date: 2026-10-18 15:02:00.810188
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c3344dc038a'
+down_revision = '3bb726788f6b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_task_due_date_id', 'task', ['due_date', 'id'],
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_task_category_id_due_date_id', 'task', ['category_id', 'due_date', 'id'],
+            postgresql_concurrently=True
+        )
+        op.create_index(
+            'ix_task_urgent_due_date_id', 'task', ['due_date', 'id'],
+            postgresql_where=sa.text('is_urgent'),
+            sqlite_where=sa.text('is_urgent = 1'),
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    op.drop_index('ix_task_urgent_due_date_id', table_name='task')
+    op.drop_index('ix_task_category_id_due_date_id', table_name='task')
+    op.drop_index('ix_task_due_date_id', table_name='task')
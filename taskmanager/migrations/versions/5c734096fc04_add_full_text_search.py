@@ -0,0 +1,69 @@
+"""add full-text search
+
+PostgreSQL gets a generated tsvector column on task with a GIN index on it
+(generated columns need PostgreSQL 12 or later, and adding one rewrites the
+table). SQLite gets an FTS5 table over task, kept in sync by triggers and
+filled from the existing tasks. See taskmanager/search.py for the queries.
+
+Revision ID: 5c734096fc04
+Revises: 8bd5fc8284d4
+Create Date: 2026-10-18 15:09:35.256970
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c734096fc04'
+down_revision = '8bd5fc8284d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute(
+            "ALTER TABLE task ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+            " setweight(to_tsvector('english', task_name), 'A') ||"
+            " setweight(to_tsvector('english', task_description), 'B')) STORED"
+        )
+        with op.get_context().autocommit_block():
+            op.execute("CREATE INDEX CONCURRENTLY ix_task_search_vector ON task USING gin (search_vector)")
+    elif dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE task_fts USING fts5("
+            " task_name, task_description, content='task', content_rowid='id', tokenize='porter unicode61')"
+        )
+        op.execute(
+            "CREATE TRIGGER task_fts_insert AFTER INSERT ON task BEGIN"
+            " INSERT INTO task_fts (rowid, task_name, task_description)"
+            " VALUES (new.id, new.task_name, new.task_description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER task_fts_delete AFTER DELETE ON task BEGIN"
+            " INSERT INTO task_fts (task_fts, rowid, task_name, task_description)"
+            " VALUES ('delete', old.id, old.task_name, old.task_description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER task_fts_update AFTER UPDATE OF task_name, task_description ON task BEGIN"
+            " INSERT INTO task_fts (task_fts, rowid, task_name, task_description)"
+            " VALUES ('delete', old.id, old.task_name, old.task_description);"
+            " INSERT INTO task_fts (rowid, task_name, task_description)"
+            " VALUES (new.id, new.task_name, new.task_description); END"
+        )
+        # index the tasks that are already there
+        op.execute("INSERT INTO task_fts (task_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_task_search_vector")
+        op.execute("ALTER TABLE task DROP COLUMN search_vector")
+    elif dialect == 'sqlite':
+        op.execute("DROP TRIGGER IF EXISTS task_fts_update")
+        op.execute("DROP TRIGGER IF EXISTS task_fts_delete")
+        op.execute("DROP TRIGGER IF EXISTS task_fts_insert")
+        op.execute("DROP TABLE IF EXISTS task_fts")
@@ -0,0 +1,40 @@
+"""add data_version table
+
+Holds one version number per table ("task" and "category"), which goes up
+with every change, so the list pages can answer conditional GET requests
+with a 304 without querying the tables themselves.
+
+Revision ID: 8bd5fc8284d4
+Revises: 4c3344dc038a
+Create Date: 2026-10-18 15:06:20.935699
+
+"""
+from datetime import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8bd5fc8284d4'
+down_revision = '4c3344dc038a'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    data_version = op.create_table(
+        'data_version',
+        sa.Column('name', sa.String(length=25), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('name')
+    )
+    now = datetime.utcnow()
+    op.bulk_insert(data_version, [
+        {'name': 'task', 'version': 0, 'updated_at': now},
+        {'name': 'category', 'version': 0, 'updated_at': now},
+    ])
+
+
+def downgrade():
+    op.drop_table('data_version')
@@ -0,0 +1,50 @@
+"""add task stats
+
+A task_stats table with the number of tasks, and of urgent tasks, in each
+category, filled from the existing tasks, and a (due_date, category_id)
+index for counting the overdue tasks and those due this week per category.
+See taskmanager/stats.py for how the totals are kept up to date.
+
+Revision ID: b53674986c9b
+Revises: 5c734096fc04
+Create Date: 2026-10-18 15:20:46.239739
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b53674986c9b'
+down_revision = '5c734096fc04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'task_stats',
+        sa.Column('category_id', sa.Integer(), nullable=False),
+        sa.Column('task_count', sa.Integer(), nullable=False),
+        sa.Column('urgent_count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['category_id'], ['category.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('category_id')
+    )
+    # the same query as "flask rebuild-stats"
+    op.execute(
+        "INSERT INTO task_stats (category_id, task_count, urgent_count)"
+        " SELECT category.id, COUNT(task.id), COALESCE(SUM(CASE WHEN task.is_urgent THEN 1 ELSE 0 END), 0)"
+        " FROM category LEFT OUTER JOIN task ON task.category_id = category.id"
+        " GROUP BY category.id"
+    )
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_task_due_date_category_id', 'task', ['due_date', 'category_id'],
+            postgresql_concurrently=True
+        )
+
+
+def downgrade():
+    op.drop_index('ix_task_due_date_category_id', table_name='task')
+    op.drop_table('task_stats')
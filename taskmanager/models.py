@@ -1,4 +1,7 @@
 # Since we will be defining the database, we obviously need to import db from the main taskmanager package.
+import sqlite3
+from datetime import datetime
+from sqlalchemy.engine import Engine
 from taskmanager import db
 # In the SQLAlchemy CRUD sample, we imported each column type at the top of the file.
 # However, with Flask-SQLAlchemy, the 'db' variable contains each of those already, and we can
@@ -13,7 +16,7 @@ class Category(db.Model): # using the default db.Model
     # string, with a maximum character count of 25
     # and each new Category added to the database should be unique, why we set that to True
     # nullable=False - to make sure it's not empty or blank, this enforces that it's a required field
-    tasks = db.relationship("Task", backref="category", cascade="all, delete", lazy=True)
+    tasks = db.relationship("Task", backref="category", cascade="all, delete", passive_deletes=True, lazy=True)
     # We'll call this variable 'tasks' plural, not to be confused with the main Task class, and for this one, 
     # we need to use db.relationship instead of db.Column. Since we aren't using db.Column, this will not be 
     # visible on the database itself like the other columns, as it's just to reference the one-to-many relationship.
@@ -22,6 +25,9 @@ class Category(db.Model): # using the default db.Model
     # in this one-to-many connection, meaning it sort of reverses and becomes many-to-one.
     # It needs to back-reference itself, but in quotes and lowercase, so backref="category".
     # 'cascade' parameter set to 'all, delete', which means it will find all related tasks and delete them.
+    # 'passive_deletes' set to True means SQLAlchemy won't load all of those tasks first, just to delete them one at a time.
+    # Instead it deletes the category alone, and leaves the tasks to the database's own ondelete="CASCADE" below,
+    # which removes them all in one go, however many there are.
     # The last parameter here is lazy=True, which means that when we query the database for
     # categories, it can simultaneously identify any task linked to the categories.
        # (See ondelete="CASCADE" EXPLAINED below)
@@ -45,6 +51,23 @@ class Task(db.Model): # using the default db.Model
     # you can see a full list of column and data types from the SQLAlchemy docs, which include Integer, Float, Text, String, Date, Boolean, etc.
     category_id = db.Column(db.Integer, db.ForeignKey("category.id", ondelete="CASCADE"), nullable=False) 
     # The value of foreign key will point to the ID from our Category class, and therefore we need to use lowercase 'category.id' in quotes.
+    __table_args__ = (
+        db.Index("ix_task_due_date_id", "due_date", "id"),
+        db.Index("ix_task_category_id_due_date_id", "category_id", "due_date", "id"),
+        db.Index(
+            "ix_task_urgent_due_date_id", "due_date", "id",
+            postgresql_where=db.text("is_urgent"),
+            sqlite_where=db.text("is_urgent = 1")
+        ),
+        db.Index("ix_task_due_date_category_id", "due_date", "category_id"),
+    )
+    # INDEXES, one for each way the app reads tasks (see migrations/versions for how they reach an existing database):
+    # 'ix_task_due_date_id' serves the home page, which sorts and paginates by (due_date, id).
+    # 'ix_task_category_id_due_date_id' starts with category_id, so the database can find every task of a category
+    # without scanning the whole table, which is needed when a category is deleted and its tasks cascade with it.
+    # 'ix_task_urgent_due_date_id' is a partial index, which only contains the urgent tasks, keeping it small.
+    # 'ix_task_due_date_category_id' lets the dashboard count the overdue tasks, and those due this week, for each category
+    # by reading just the part of the index up to the end of the week, without touching the table itself.
     def __repr__(self): # __repr__ to represent (the class object) itself in the form of a string 
         return "#{0} - Task: {1} | Urgent: {2}".format(
             self.id, self.task_name, self.is_urgent
@@ -54,6 +77,55 @@ class Task(db.Model): # using the default db.Model
     # We'll use placeholders of {0}, {1}, and {2}, and then the Python .format() method to specify
     # that these equate to self.id, self.task_name, and self.is_urgent.
 
+# SQLite only enforces foreign keys, and so only runs our ondelete="CASCADE", once it's been switched on for each connection.
+# PostgreSQL always enforces them, so this only does anything for the SQLite databases used in local development.
+@db.event.listens_for(Engine, "connect")
+def enable_sqlite_foreign_keys(dbapi_connection, connection_record):
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+# 3rd table keeps a version number for each of the tables above
+class DataVersion(db.Model):
+    # Schema for the DataVersion Model
+    name = db.Column(db.String(25), primary_key=True) # the name of the table being tracked, "task" or "category"
+    version = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False) # always stored in UTC
+
+    def __repr__(self):
+        return "{0} v{1}".format(self.name, self.version)
+    # Every time a task or category is added, edited or deleted, the matching version number goes up by one,
+    # in the same transaction as the change itself (see versions.py). Because it lives in the database,
+    # every worker of the app sees the same numbers, so they make a cheap "has anything changed?" check.
+
+
+# the two rows are created together with the table, when it's built by db.create_all() (the migration adds them too)
+@db.event.listens_for(DataVersion.__table__, "after_create")
+def create_data_versions(table, connection, **kwargs):
+    now = datetime.utcnow()
+    connection.execute(table.insert(), [
+        {"name": "task", "version": 0, "updated_at": now},
+        {"name": "category", "version": 0, "updated_at": now},
+    ])
+
+
+# 4th table keeps running totals of the tasks in each category, for the dashboard
+class TaskStats(db.Model):
+    # Schema for the TaskStats Model
+    category_id = db.Column(db.Integer, db.ForeignKey("category.id", ondelete="CASCADE"), primary_key=True)
+    task_count = db.Column(db.Integer, default=0, nullable=False)
+    urgent_count = db.Column(db.Integer, default=0, nullable=False)
+
+    def __repr__(self):
+        return "category #{0}: {1} tasks, {2} urgent".format(self.category_id, self.task_count, self.urgent_count)
+    # Counting every task of every category on each visit to the dashboard would read the whole task table.
+    # Instead, each change to a task adds to, or takes away from, these totals in the same transaction (see stats.py),
+    # and the row disappears together with its category, thanks to ondelete="CASCADE".
+    # If they ever drift (after editing the database by hand, say), "flask rebuild-stats" counts everything again.
+
+
 # ondelete="CASCADE" EXPLAINED
 # In addition to this, we are going to apply something called ondelete="CASCADE" for this foreign key.
 # Since each of our tasks need a category selected, this is what's known as a one-to-many relationship.
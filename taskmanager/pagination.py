@@ -0,0 +1,69 @@
+# Keyset (or "cursor") pagination helpers for the task list.
+# Instead of using OFFSET, which makes the database walk past every skipped row, each page remembers
+# the (due_date, id) of its first and last task, and the next page simply asks for the rows that come
+# after that pair. With an index on (due_date, id), every page costs the same no matter how deep we go.
+from datetime import date
+from taskmanager import db
+
+
+def encode_cursor(task):
+    # a cursor is just the sort key of a task, written as "2022-09-05.12" so it's safe inside a URL
+    return "{0}.{1}".format(task.due_date.isoformat(), task.id)
+
+
+def decode_cursor(cursor):
+    # returns a (due_date, id) tuple, or None if the cursor is missing or has been tampered with
+    if not cursor:
+        return None
+    try:
+        due_date, task_id = cursor.rsplit(".", 1)
+        return date.fromisoformat(due_date), int(task_id)
+    except ValueError:
+        return None
+
+
+class KeysetPage:
+    # A single page of results, plus the cursors needed to build the "Newer" and "Older" links.
+    def __init__(self, items, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_prev(self):
+        return self.prev_cursor is not None
+
+
+def keyset_paginate(query, sort_columns, per_page, after=None, before=None):
+    # 'sort_columns' must be the full, unique sort key, e.g. (Task.due_date, Task.id),
+    # and 'after'/'before' are decoded cursors holding one value for each of those columns.
+    key = db.tuple_(*sort_columns)
+    if before is not None:
+        # walking backwards: flip the ordering, then reverse the rows again once we have them
+        query = query.filter(key < db.tuple_(*before))
+        query = query.order_by(*[column.desc() for column in sort_columns])
+    else:
+        if after is not None:
+            query = query.filter(key > db.tuple_(*after))
+        query = query.order_by(*sort_columns)
+
+    # we ask for one extra row, which tells us whether there is another page without running a COUNT(*)
+    rows = query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if before is not None:
+        rows.reverse()
+
+    if not rows:
+        return KeysetPage(rows)
+    if before is not None:
+        next_cursor = encode_cursor(rows[-1])
+        prev_cursor = encode_cursor(rows[0]) if has_more else None
+    else:
+        next_cursor = encode_cursor(rows[-1]) if has_more else None
+        prev_cursor = encode_cursor(rows[0]) if after is not None else None
+    return KeysetPage(rows, next_cursor=next_cursor, prev_cursor=prev_cursor)
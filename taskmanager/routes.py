@@ -1,12 +1,44 @@
-from flask import render_template, request, redirect, url_for
-from taskmanager import app, db
+from datetime import date, datetime
+from flask import Blueprint, abort, current_app, render_template, request, redirect, url_for
+from taskmanager import db, deletion, stats
 from taskmanager.models import Category, Task # "taskmanager.model" - to access model file inside the taskmanager folder
+from taskmanager.caching import get_categories, invalidate_categories
+from taskmanager.database import lock_for_update, use_replica
+from taskmanager.pagination import decode_cursor, keyset_paginate
+from taskmanager.search import search_tasks
+from taskmanager.versions import conditional
 
+main = Blueprint("main", __name__)
+# All of the pages live on the "main" blueprint, which create_app() (see __init__.py) registers on the app.
+# That makes their endpoint names "main.home", "main.categories" and so on, which is what url_for() needs.
 
-@app.route("/")
+
+def form_due_date():
+    # The datepicker (see script.js) sends dates like "05 September, 2022". PostgreSQL could read that text by itself,
+    # but SQLite only takes real date objects, so we turn it into one here, and ISO dates (2022-09-05) work too.
+    value = request.form.get("due_date", "")
+    try:
+        return datetime.strptime(value, "%d %B, %Y").date()
+    except ValueError:
+        pass
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        abort(400)
+
+
+@main.route("/")
+@use_replica
+@conditional("category", "task")
 def home():
-    tasks = list(Task.query.order_by(Task.id).all())
-    return render_template("tasks.html", tasks=tasks)
+    page = keyset_paginate(
+        Task.query.options(db.joinedload(Task.category, innerjoin=True)),
+        (Task.due_date, Task.id),
+        per_page=current_app.config["TASKS_PER_PAGE"],
+        after=decode_cursor(request.args.get("after")),
+        before=decode_cursor(request.args.get("before"))
+    )
+    return render_template("tasks.html", tasks=page.items, page=page)
 # we create a basic "app route" using the root-level directory of slash
 # This will be used to target a function called 'home', which will just 
 # return the rendered_template of "base.html" that we will create shortly.
@@ -20,10 +52,47 @@ def home():
 # Using the imported Task model, we query all tasks found, and if you wanted to, you could have them ordered by the Task.id as well. 
 # The only thing left to do on this file is to pass that list over to the front-end template, which we will also call 'tasks', and set that to our tasks list above.
 
+# PAGINATION
+# Loading every task at once, and then sorting them in Jinja, gets slower and slower as the table grows.
+# Instead, the database sorts the tasks by (due_date, id) and we only fetch one page at a time, using the
+# 'after' or 'before' cursor from the URL to know where the previous page stopped (see pagination.py).
+# The joinedload() option fetches each task's category in the same query, so that {{ task.category }}
+# on the template doesn't trigger one extra query per task (the so-called "N+1" problem).
+# The @conditional decorator (see versions.py) answers "304 Not Modified" when the browser already has the latest
+# version of this page, which skips the query and the template. The page shows category names too, so it depends on both tables.
+# @use_replica (see database.py) lets the GET requests of this page read from the replica database, when there is one.
+# The other pages that only read on GET (search, categories, and the forms) are marked the same way, while
+# anything that writes, like the POST side of the forms or the delete links, always goes to the primary.
+
+
+@main.route("/search")
+@use_replica
+@conditional("category", "task")
+def search():
+    query = request.args.get("q", "").strip()
+    page = max(request.args.get("page", 1, type=int), 1)
+    tasks, has_next = search_tasks(query, page, current_app.config["TASKS_PER_PAGE"]) if query else ([], False)
+    return render_template("search.html", query=query, tasks=tasks, page=page, has_next=has_next)
+# The search box on the home page sends its text here as "q", and 'search_tasks' (see search.py) looks it up in the
+# database's own full-text index, so it stays quick however many tasks there are, instead of checking every task.
+# The results are ranked, best match first, so they're split into numbered pages rather than by due date.
+
+
+@main.route("/dashboard")
+@use_replica
+def dashboard():
+    return render_template("dashboard.html", stats=stats.summary())
+# The dashboard shows how many tasks, urgent tasks, overdue tasks and tasks due this week each category has.
+# stats.summary() (see stats.py) reads the first two from the small task_stats table, which every change keeps up to date,
+# and counts the other two with one GROUP BY over the due_date index, so the page never reads the whole task table.
+# It isn't @conditional, because "overdue" can change overnight without any task changing at all.
 
-@app.route("/categories")
+
+@main.route("/categories")
+@use_replica
+@conditional("category")
 def categories():
-    categories = list(Category.query.order_by(Category.category_name).all())
+    categories = get_categories()
     return render_template("categories.html", categories=categories)
 
 # Category.query.all() - query the 'Category' model imported at the top of the file from our models.py file
@@ -44,14 +113,19 @@ def categories():
 # which is why, once again, it's important to keep your naming convention quite similar.
 
 # now that we have this template variable available to us, we then go back to our categories.html template, to incorporate it into our cards.
+# Just like the home page, @conditional("category") lets a browser that already has the latest list skip the query entirely.
+# The list itself now comes from get_categories() (see caching.py), which keeps it in memory between requests,
+# since categories are read on almost every page but hardly ever change.
 
-@app.route("/add_category", methods=["GET", "POST"])
+@main.route("/add_category", methods=["GET", "POST"])
+@use_replica
 def add_category():
     if request.method == "POST":
         category = Category(category_name=request.form.get("category_name"))
         db.session.add(category)
         db.session.commit()
-        return redirect(url_for("categories"))
+        invalidate_categories()
+        return redirect(url_for("main.categories"))
     return render_template("add_category.html")
 # we include a list of the two methods: "GET" and "POST",  because we'll be submitting a form to the database.
 # When a user clicks to add a new category, it should render the template that contains
@@ -78,6 +152,9 @@ def add_category():
 # we could redirect the user back to the 'categories' page.
 # 'redirect' and 'url_for' classes at the top of the file from our flask import.
 
+# Once the new category is committed, invalidate_categories() throws away the cached list of categories (see caching.py),
+# so the dropdowns on the task forms include it straight away. edit_category and delete_category do the same.
+
 # so let's quickly recap what's happening here.
 # When a user clicks the "Add Category" button, this will use the "GET" method and render the 'add_category' template.
 # Once they submit the form, this will call the same function, but will check if the request
@@ -88,20 +165,21 @@ def add_category():
 # Also, in a real-world scenario in a production environment, you'd probably want to consider
 # adding defensive programming to handle brute-force attacks, along with some error handling.
 
-@app.route("/add_task", methods=["GET", "POST"])
+@main.route("/add_task", methods=["GET", "POST"])
+@use_replica
 def add_task():
-    categories = list(Category.query.order_by(Category.category_name).all())
     if request.method == "POST":
         task = Task(
             task_name=request.form.get("task_name"),
             task_description=request.form.get("task_description"),
             is_urgent=bool(True if request.form.get("is_urgent") else False),
-            due_date=request.form.get("due_date"),
+            due_date=form_due_date(),
             category_id=request.form.get("category_id")
         )
         db.session.add(task)
         db.session.commit()
-        return redirect(url_for("home"))
+        return redirect(url_for("main.home"))
+    categories = get_categories()
     return render_template("add_task.html", categories=categories)
 # this function will render a new template for users to add a new Task, and then commit those new tasks to the database if the form is submitted. 
 # It's actually quite similar to the 'add_category' function. However, each task actually requires the user to select a category for that task. 
@@ -126,19 +204,24 @@ def add_task():
 # As a reminder, the first 'categories' listed is the variable name that we will be able to use on the template itself.
 # The second 'categories' is simply the list of categories retrieved from the database defined above.
 # That's all we need for the 'add_task' function, which will render the template for new tasks.
+# The categories are only needed to build the dropdown on the GET side, so the POST side doesn't look them up at all,
+# and get_categories() usually answers from its in-memory cache (see caching.py) instead of querying the database.
 # The next thing we need to do is build that template which allows users to add new tasks: "add_task.html"
 
-@app.route("/edit_task/<int:task_id>", methods=["GET", "POST"])
+@main.route("/edit_task/<int:task_id>", methods=["GET", "POST"])
+@use_replica
 def edit_task(task_id):
-    task = Task.query.get_or_404(task_id)
-    categories = list(Category.query.order_by(Category.category_name).all())
     if request.method == "POST":
+        task = lock_for_update(Task.query.filter_by(id=task_id)).first_or_404()
         task.task_name = request.form.get("task_name")
         task.task_description = request.form.get("task_description")
         task.is_urgent = bool(True if request.form.get("is_urgent") else False)
-        task.due_date = request.form.get("due_date")
+        task.due_date = form_due_date()
         task.category_id = request.form.get("category_id")
         db.session.commit()
+    else:
+        task = Task.query.get_or_404(task_id)
+    categories = get_categories()
     return render_template("edit_task.html", task=task, categories=categories)
 # when we created the edit_category function, we used the 'get_or_404()' method, which queries the database using that task ID.
 # Now, instead of using the Task model, we can simply update each column-header using dot-notation.
@@ -148,16 +231,20 @@ def edit_task(task_id):
 # If we don't include all fields, and the user only updates the task_name for example, then the other fields risk being deleted entirely.
 # Since we are modifying the specific task here, we don't need to use session.add(), and only session.commit() is required for saving these changes. 
 # Finally, we just need to render our new template of 'edit_task.html', and along with the normal 'categories' selection, we need to pass through the task itself.
+# On POST, the task is loaded with lock_for_update() (see database.py), so that when two people save the same task
+# at the same time, the second one waits for the first, and the task stats (see stats.py) only change once.
 
 # Next, open up the tasks.html template because we need a method for users to click a button that opens up this template for editing.
 
-@app.route("/edit_category/<int:category_id>", methods=["GET", "POST"])
+@main.route("/edit_category/<int:category_id>", methods=["GET", "POST"])
+@use_replica
 def edit_category(category_id):
     category = Category.query.get_or_404(category_id)
     if request.method == "POST":
         category.category_name = request.form.get("category_name")
         db.session.commit()
-        return redirect(url_for("categories"))
+        invalidate_categories()
+        return redirect(url_for("main.categories"))
     return render_template("edit_category.html", category=category)
 
 # once we added the primary key of ID into our app.route function, it will now always expect this for any link that calls this function. 
@@ -168,12 +255,29 @@ def edit_category(category_id):
 # What this does is query the database and attempts to find the specified record using the data
 # provided, and if no match is found, it will trigger a 404 error page.
 
-@app.route("/delete_category/<int:category_id>")
+@main.route("/delete_category/<int:category_id>")
 def delete_category(category_id):
     category = Category.query.get_or_404(category_id)
+    threshold = current_app.config["CATEGORY_DELETE_BACKGROUND_THRESHOLD"]
+    if threshold and deletion.has_more_tasks_than(category.id, threshold):
+        deletion.start_background_delete(category.id)
+        return redirect(url_for("main.delete_category_progress", category_id=category.id))
     db.session.delete(category)
     db.session.commit()
-    return redirect(url_for("categories"))
+    invalidate_categories()
+    return redirect(url_for("main.categories"))
+
+
+@main.route("/delete_category/<int:category_id>/progress")
+@use_replica
+def delete_category_progress(category_id):
+    category = Category.query.get(category_id)
+    if category is None:
+        return redirect(url_for("main.categories"))
+    # picks the delete up again if the worker that was running it has stopped (see deletion.py)
+    deletion.start_background_delete(category.id)
+    remaining = deletion.remaining_tasks(category.id)
+    return render_template("delete_category.html", category=category, remaining=remaining)
 
 # As is tradition by now, our function name will take the same name, "delete_category"
 # First, we need to pass the category ID into our app route and function, and once again, we are casting it as an integer.
@@ -181,8 +285,17 @@ def delete_category(category_id):
 # If there isn't a matching record found, then it should automatically return an error 404 page.
 # Then, using the database session, we need to perform the .delete() method using that 'category' variable, and then commit the session changes.
 # Finally, once that's been deleted and our session has been committed, we can simply redirect the user back to the function above called "categories".
+# Thanks to passive_deletes=True on Category.tasks (see models.py), deleting the category doesn't load any of its tasks,
+# and the database removes them itself through the ondelete="CASCADE" on their foreign key.
+
+# DELETING LARGE CATEGORIES
+# A category with a huge number of tasks would still be deleted in one big transaction, while the user waits.
+# So when it has more than CATEGORY_DELETE_BACKGROUND_THRESHOLD tasks (0 turns this off), a background thread deletes
+# the tasks in small batches instead (see deletion.py), and the user is sent to the 'delete_category_progress' page.
+# That page counts the tasks still left, and reloads itself every few seconds until the category is gone.
+# It also starts the delete again, in case the worker that was running it has been restarted in the meantime.
 
-# Then go to the "categories" template to update our href link: {{ url_for('delete_category', category_id=category.id)}}
+# Then go to the "categories" template to update our href link: {{ url_for('main.delete_category', category_id=category.id)}}
 # As you can see, since we are within the for-loop of all categories, it's using the current
 # iteration variable of 'category', and then targeting the key of 'id' from that record.
 # The 'category_id' assigned is just the variable name we're passing into the "app.route" function that we just created within the routes.py file.
@@ -195,12 +308,12 @@ def delete_category(category_id):
 # Thus wrapping any query in a Python list(), which is considered best practice.
 
 # DELETE TASK 
-@app.route("/delete_task/<int:task_id>")
+@main.route("/delete_task/<int:task_id>")
 def delete_task(task_id):
     task = Task.query.get_or_404(task_id)
     db.session.delete(task)
     db.session.commit()
-    return redirect(url_for("home"))
+    return redirect(url_for("main.home"))
 # When this function is called, it takes the 'task_id' variable, and tries to query the database to find that particular task.
 # It will then remove the task using the .delete() method, and then commit those changes to our database.
 # Once the task is deleted, we redirect the user back to the home page where our tasks are displayed.
@@ -0,0 +1,82 @@
+# Full-text search over task names and descriptions.
+# Searching with LIKE '%word%' has to read every single task, so instead each database keeps a proper full-text index:
+#   - PostgreSQL: a generated 'search_vector' tsvector column on the task table, with a GIN index on it.
+#   - SQLite: an FTS5 virtual table called 'task_fts', kept in sync with the task table by triggers.
+# Neither of them is part of the Task model, since they only exist on one kind of database each. They're created
+# by the migrations, or by the DDL below when the tables are built with db.create_all() instead.
+# Task names count for more than descriptions when the results are ranked.
+from sqlalchemy import DDL
+from taskmanager import db
+from taskmanager.models import Task
+
+POSTGRESQL_DDL = [
+    "ALTER TABLE task ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+    " setweight(to_tsvector('english', task_name), 'A') ||"
+    " setweight(to_tsvector('english', task_description), 'B')) STORED",
+    "CREATE INDEX ix_task_search_vector ON task USING gin (search_vector)",
+]
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE task_fts USING fts5("
+    " task_name, task_description, content='task', content_rowid='id', tokenize='porter unicode61')",
+    "CREATE TRIGGER task_fts_insert AFTER INSERT ON task BEGIN"
+    " INSERT INTO task_fts (rowid, task_name, task_description)"
+    " VALUES (new.id, new.task_name, new.task_description); END",
+    "CREATE TRIGGER task_fts_delete AFTER DELETE ON task BEGIN"
+    " INSERT INTO task_fts (task_fts, rowid, task_name, task_description)"
+    " VALUES ('delete', old.id, old.task_name, old.task_description); END",
+    "CREATE TRIGGER task_fts_update AFTER UPDATE OF task_name, task_description ON task BEGIN"
+    " INSERT INTO task_fts (task_fts, rowid, task_name, task_description)"
+    " VALUES ('delete', old.id, old.task_name, old.task_description);"
+    " INSERT INTO task_fts (rowid, task_name, task_description)"
+    " VALUES (new.id, new.task_name, new.task_description); END",
+]
+
+for statement in POSTGRESQL_DDL:
+    db.event.listen(Task.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in SQLITE_DDL:
+    db.event.listen(Task.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+# with the content='task' option, FTS5 reads the text from the task table itself, so the index stores no second copy,
+# but the DELETE trigger has to hand it the old values, which is why 'delete' rows look a little unusual above.
+db.event.listen(Task.__table__, "before_drop", DDL("DROP TABLE IF EXISTS task_fts").execute_if(dialect="sqlite"))
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    # Tells "flask db migrate" to leave the search objects alone, since they aren't in models.py
+    # and it would otherwise offer to drop them every time.
+    if type_ == "table" and name.startswith("task_fts"):
+        return False
+    if name in ("search_vector", "ix_task_search_vector"):
+        return False
+    return True
+
+
+def _fts5_query(text):
+    # every word becomes a quoted string, so characters like - or * that mean something to FTS5 are just searched for
+    return " ".join('"{0}"'.format(word.replace('"', '""')) for word in text.split())
+
+
+def search_tasks(text, page=1, per_page=25):
+    """Return (tasks, has_next) for one page of the tasks matching 'text', best matches first."""
+    query = Task.query.options(db.joinedload(Task.category, innerjoin=True))
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        ts_query = db.func.plainto_tsquery("english", text)
+        vector = db.literal_column("task.search_vector")
+        query = query.filter(vector.op("@@")(ts_query)).order_by(db.func.ts_rank_cd(vector, ts_query).desc(), Task.id)
+    elif dialect == "sqlite":
+        task_fts = db.table("task_fts", db.column("rowid"))
+        query = (
+            query.join(task_fts, task_fts.c.rowid == Task.id)
+            .filter(db.text("task_fts MATCH :terms").bindparams(terms=_fts5_query(text)))
+            # bm25() gives lower scores to better matches, with the name weighted 10 times more than the description
+            .order_by(db.text("bm25(task_fts, 10.0, 1.0)"), Task.id)
+        )
+    else:
+        # any other database gets a plain (unindexed) search, which is fine for small amounts of tasks
+        pattern = "%{0}%".format(text)
+        query = query.filter(db.or_(Task.task_name.ilike(pattern), Task.task_description.ilike(pattern)))
+        query = query.order_by(Task.due_date, Task.id)
+    # one extra row tells us whether there is a next page, without counting every match
+    tasks = query.offset((page - 1) * per_page).limit(per_page + 1).all()
+    return tasks[:per_page], len(tasks) > per_page
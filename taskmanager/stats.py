@@ -0,0 +1,216 @@
+# Task statistics for the dashboard.
+# The number of tasks, and of urgent tasks, in each category is kept up to date in the task_stats table (see models.py):
+#   - the after_flush listener below covers everything written through the ORM, like the add, edit and delete routes,
+#   - the bulk writes (bulk.py, deletion.py) skip the flush, so they call add_categories(), add_rows(), add_ids()
+#     or remove_ids() themselves,
+#   - deleting a category deletes its task_stats row too, through ondelete="CASCADE".
+# Each change only adds to, or takes away from, the totals of the categories it touched, in the same transaction,
+# so the dashboard never has to count the task table. "flask rebuild-stats" counts everything again, if they ever drift.
+# "Overdue" and "due this week" change with the date rather than with the data, so they can't be kept as totals.
+# They come from one GROUP BY over the index on (due_date, category_id) instead, which only reads up to the end of the week.
+# Every write updates the task_stats rows first, and the data_version rows (versions.bump) last. Two transactions
+# that lock the same rows in opposite orders can deadlock on PostgreSQL, so any new write path has to keep that order.
+from datetime import date, timedelta
+from taskmanager import db
+from taskmanager.database import lock_for_update
+from taskmanager.models import Category, Task, TaskStats
+
+
+def _add(changes, category_id, tasks, urgent):
+    totals = changes.setdefault(int(category_id), [0, 0])
+    totals[0] += tasks
+    totals[1] += urgent
+
+
+def apply(session, changes):
+    """Add each category's (tasks, urgent) change in 'changes' to its totals, inside the session's transaction."""
+    if not changes:
+        return
+    table = TaskStats.__table__
+    connection = session.connection()
+    # Two statements, however many categories changed. First, any category without a row yet gets a row of zeros
+    # (unless the category itself is gone by now), with one INSERT ... SELECT over all of the changed IDs.
+    connection.execute(table.insert().from_select(
+        ["category_id", "task_count", "urgent_count"],
+        db.select(Category.id, db.literal(0), db.literal(0))
+        .where(Category.id.in_(list(changes)))
+        .where(~db.exists().where(table.c.category_id == Category.id))
+    ))
+    # Then every change is added to its row by one UPDATE, sent as an executemany(), in category order
+    connection.execute(
+        table.update()
+        .where(table.c.category_id == db.bindparam("changed_category_id"))
+        .values(
+            task_count=table.c.task_count + db.bindparam("task_change"),
+            urgent_count=table.c.urgent_count + db.bindparam("urgent_change")
+        ),
+        [
+            {"changed_category_id": category_id, "task_change": tasks, "urgent_change": urgent}
+            for category_id, (tasks, urgent) in sorted(changes.items())
+        ]
+    )
+
+
+def add_categories(session, category_ids):
+    """Give newly inserted categories their row of zeros, in one statement (the ORM's are added by the listener below)."""
+    rows = [{"category_id": category_id, "task_count": 0, "urgent_count": 0} for category_id in sorted(category_ids)]
+    if rows:
+        session.connection().execute(TaskStats.__table__.insert(), rows)
+
+
+def add_rows(session, rows):
+    """Count newly inserted tasks, given as the dicts that were written (with 'category_id' and 'is_urgent')."""
+    changes = {}
+    for row in rows:
+        _add(changes, row["category_id"], 1, int(bool(row.get("is_urgent"))))
+    apply(session, changes)
+
+
+def _changes_for_ids(session, ids, sign):
+    # The rows are locked (FOR UPDATE) as they're counted, so two requests deleting or updating the same tasks
+    # at once can't both take them out of the totals: the second one waits for the first to commit, and then
+    # no longer finds the deleted tasks, or finds them as they are after the first one's update.
+    # PostgreSQL doesn't allow FOR UPDATE with GROUP BY, so the rows are added up here rather than in SQL, and
+    # they're locked in ID order, so that two overlapping batches can't deadlock on each other.
+    changes = {}
+    for chunk_start in range(0, len(ids), 1000):
+        chunk = ids[chunk_start:chunk_start + 1000]
+        query = lock_for_update(
+            session.query(Task.category_id, Task.is_urgent)
+            .filter(Task.id.in_(chunk))
+            .order_by(Task.id)
+        )
+        for category_id, is_urgent in query:
+            _add(changes, category_id, sign, sign * int(bool(is_urgent)))
+    return changes
+
+
+def add_ids(session, ids):
+    """Count the tasks with these IDs, as they are now in the database (after inserting or updating them)."""
+    apply(session, _changes_for_ids(session, sorted(ids), 1))
+
+
+def remove_ids(session, ids):
+    """Stop counting the tasks with these IDs, before they are deleted, or before they're updated and added again."""
+    apply(session, _changes_for_ids(session, sorted(ids), -1))
+
+
+def _old_value(state, name):
+    # the value an attribute had before this flush
+    history = state.attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.unchanged:
+        return history.unchanged[0]
+    return getattr(state.object, name)
+
+
+@db.event.listens_for(db.session, "after_flush", insert=True)
+def track_task_changes(session, flush_context):
+    # Straight after the flush, the ORM still knows which objects were just written, and what they were before.
+    # insert=True runs this before every other after_flush listener, whichever module was imported first,
+    # so the stats are always updated before versions.bump_changed_tables() (see the top of this file).
+    changes = {}
+    deleted_categories = {obj.id for obj in session.deleted if isinstance(obj, Category)}
+    for obj in session.new:
+        if isinstance(obj, Task):
+            _add(changes, obj.category_id, 1, int(bool(obj.is_urgent)))
+        elif isinstance(obj, Category):
+            # every new category starts with a row of zeros, so its first tasks only ever need an UPDATE
+            _add(changes, obj.id, 0, 0)
+    for obj in session.deleted:
+        if isinstance(obj, Task) and obj.category_id not in deleted_categories:
+            _add(changes, obj.category_id, -1, -int(bool(obj.is_urgent)))
+    # The old values are the ones the task was loaded with, so a view that changes a task has to load it with
+    # lock_for_update() (see database.py), like edit_task does. Otherwise two edits of the same task could
+    # both start from the same old values, and both change the totals.
+    for obj in session.dirty:
+        if not isinstance(obj, Task) or obj in session.deleted:
+            continue
+        state = db.inspect(obj)
+        if not (state.attrs.category_id.history.has_changes() or state.attrs.is_urgent.history.has_changes()):
+            continue
+        old_category_id, old_urgent = _old_value(state, "category_id"), _old_value(state, "is_urgent")
+        # the form sends '3' for category 3, which is the same category, so both are compared as numbers
+        if int(old_category_id) == int(obj.category_id) and bool(old_urgent) == bool(obj.is_urgent):
+            continue
+        _add(changes, old_category_id, -1, -int(bool(old_urgent)))
+        _add(changes, obj.category_id, 1, int(bool(obj.is_urgent)))
+    if changes:
+        apply(session, changes)
+
+
+def due_query(today):
+    # one pass over the tasks due by the end of the week (Sunday), split into overdue and not yet due
+    end_of_week = today + timedelta(days=6 - today.weekday())
+    overdue = db.func.sum(db.case((Task.due_date < today, 1), else_=0))
+    this_week = db.func.sum(db.case((Task.due_date >= today, 1), else_=0))
+    # Grouping by "+category_id" rather than "category_id" stops SQLite from reading the whole
+    # (category_id, due_date, id) index just because it's already in category order, when the range of
+    # ix_task_due_date_category_id up to Sunday is much smaller. PostgreSQL reads that range either way.
+    category_id = db.literal_column("+task.category_id", db.Integer)
+    return (
+        db.session.query(category_id, overdue, this_week)
+        .filter(Task.due_date <= end_of_week)
+        .group_by(category_id)
+    )
+
+
+def due_counts(today=None):
+    """Return {category_id: (overdue, due_this_week)}, where the week ends on Sunday."""
+    query = due_query(today or date.today())
+    return {category_id: (overdue or 0, this_week or 0) for category_id, overdue, this_week in query}
+
+
+def summary(today=None):
+    """Return the dashboard numbers: one dict per category, sorted by name, and the totals of all of them."""
+    due = due_counts(today)
+    rows = (
+        db.session.query(
+            Category.id, Category.category_name,
+            db.func.coalesce(TaskStats.task_count, 0), db.func.coalesce(TaskStats.urgent_count, 0)
+        )
+        .outerjoin(TaskStats, TaskStats.category_id == Category.id)
+        .order_by(Category.category_name)
+    )
+    categories = []
+    totals = {"tasks": 0, "urgent": 0, "overdue": 0, "due_this_week": 0}
+    for category_id, name, tasks, urgent in rows:
+        overdue, this_week = due.get(category_id, (0, 0))
+        category = {
+            "id": category_id, "category_name": name, "tasks": tasks, "urgent": urgent,
+            "overdue": overdue, "due_this_week": this_week,
+        }
+        categories.append(category)
+        for key in totals:
+            totals[key] += category[key]
+    return {"categories": categories, "totals": totals}
+
+
+def _counted():
+    # what the totals should be, counted from the task table itself
+    urgent = db.func.sum(db.case((Task.is_urgent, 1), else_=0))
+    return (
+        db.session.query(Category.id, db.func.count(Task.id), db.func.coalesce(urgent, 0))
+        .outerjoin(Task, Task.category_id == Category.id)
+        .group_by(Category.id)
+    )
+
+
+def drift():
+    """Return (category_id, stored, counted) for every category whose stored totals are wrong."""
+    stored = {row.category_id: (row.task_count, row.urgent_count) for row in TaskStats.query}
+    return [
+        (category_id, stored.get(category_id), (tasks, urgent))
+        for category_id, tasks, urgent in _counted()
+        if stored.get(category_id) != (tasks, urgent)
+    ]
+
+
+def rebuild():
+    """Count every category's tasks again and replace the stored totals, without committing."""
+    table = TaskStats.__table__
+    db.session.execute(table.delete())
+    db.session.execute(table.insert().from_select(
+        ["category_id", "task_count", "urgent_count"], _counted().statement
+    ))
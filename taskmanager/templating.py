@@ -0,0 +1,40 @@
+# A Jinja bytecode cache for our templates.
+# Every worker process compiles each template into Python code the first time it renders it, which makes the first
+# requests after a deploy (or after a worker restarts) noticeably slower than the rest. With JINJA_BYTECODE_CACHE set,
+# the compiled code is written to that folder, and later workers load it from there instead of compiling it again.
+# "flask precompile-templates" fills the folder in one go, so it can run while the app is being built (see
+# bin/post_compile), before any worker starts. Each cached template is keyed by a checksum of its source,
+# so a changed template is simply compiled again, never served from an out-of-date cache.
+import logging
+import os
+from jinja2 import FileSystemBytecodeCache
+
+logger = logging.getLogger(__name__)
+
+
+def init_app(app):
+    folder = app.config["JINJA_BYTECODE_CACHE"]
+    if not folder:
+        return
+    try:
+        os.makedirs(folder, exist_ok=True)
+    except OSError as error:
+        # a read-only file system only means the templates are compiled in memory, as they would be without the cache
+        logger.warning("Not caching compiled templates in %s: %s", folder, error)
+        return
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(folder)
+
+
+def template_names(app):
+    """Return the name of every template in taskmanager/templates."""
+    return sorted(app.jinja_env.list_templates(extensions=["html"]))
+
+
+def precompile(app):
+    """Compile every template (or load it from the bytecode cache), and return their names."""
+    names = template_names(app)
+    for name in names:
+        # get_template() compiles the template, writes it to the bytecode cache, and keeps it in the
+        # environment's own cache, so a process that forks after this never has to compile it again
+        app.jinja_env.get_template(name)
+    return names
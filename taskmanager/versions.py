@@ -0,0 +1,99 @@
+# Data versions and conditional GET requests for the list pages.
+# Most of our traffic is people (and scripts) reloading the home and categories pages when nothing has changed.
+# Each change to a task or category bumps its row in the data_version table, in the same transaction as the change,
+# and the list pages send that version as an ETag. When a browser asks again with "If-None-Match" (or
+# "If-Modified-Since") and the version is still the same, we answer "304 Not Modified" straight away, after one
+# tiny primary-key lookup, without running the list query or rendering the template at all.
+# The versions live in the database, so this works the same however many gunicorn workers are running.
+import hashlib
+import os
+from datetime import datetime, timezone
+from functools import wraps
+from flask import current_app, g, make_response, request
+from werkzeug.http import is_resource_modified
+from taskmanager import db
+from taskmanager.models import Category, DataVersion, Task
+
+TRACKED = {Task: "task", Category: "category"}
+
+
+def bump(session, *names):
+    """Add one to the version of each named table, inside the session's current transaction.
+
+    Call it after any other write in the transaction, so the data_version rows are always locked last (see stats.py).
+    """
+    names = set(names)
+    if not names:
+        return
+    # the names are also kept on the session, so other code can react once the transaction is committed
+    session.info.setdefault("changed_tables", set()).update(names)
+    table = DataVersion.__table__
+    session.connection().execute(
+        table.update()
+        .where(table.c.name.in_(names))
+        .values(version=table.c.version + 1, updated_at=datetime.utcnow())
+    )
+
+
+@db.event.listens_for(db.session, "after_flush")
+def bump_changed_tables(session, flush_context):
+    # The ORM tells us which objects were just written, so every route that uses db.session.add(),
+    # db.session.delete() or edits an object is covered automatically. (The bulk writes in bulk.py
+    # skip the flush, so they call bump() themselves.)
+    names = set()
+    for obj in session.new | session.deleted:
+        names.add(TRACKED.get(type(obj)))
+    for obj in session.dirty:
+        if session.is_modified(obj):
+            names.add(TRACKED.get(type(obj)))
+    if any(isinstance(obj, Category) for obj in session.deleted):
+        # deleting a category deletes its tasks too, even when the database does that for us
+        names.add("task")
+    names.discard(None)
+    bump(session, *names)
+
+
+@db.event.listens_for(db.session, "after_transaction_end")
+def forget_changed_tables(session, transaction):
+    # by now any after_commit listeners have seen the changed tables, so the list starts afresh with the next transaction
+    if transaction.parent is None:
+        session.info.pop("changed_tables", None)
+
+
+def _templates_hash():
+    # A new deployment can change the HTML while the data stays the same, so the templates are part of
+    # the ETag too. Hashing their contents gives every worker running the same code the same value.
+    if "templates_hash" not in current_app.extensions:
+        digest = hashlib.sha1()
+        folder = os.path.join(current_app.root_path, current_app.template_folder)
+        for root, dirs, files in sorted(os.walk(folder)):
+            for name in sorted(files):
+                with open(os.path.join(root, name), "rb") as file:
+                    digest.update(file.read())
+        current_app.extensions["templates_hash"] = digest.hexdigest()[:8]
+    return current_app.extensions["templates_hash"]
+
+
+def conditional(*names):
+    """Make a GET view answer 304 Not Modified while the named tables haven't changed."""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(*args, **kwargs)
+            versions = DataVersion.query.filter(DataVersion.name.in_(names)).order_by(DataVersion.name).all()
+            # kept for the view too, so it doesn't have to read them again (see get_categories() in caching.py)
+            g.data_versions = {row.name: row.version for row in versions}
+            etag = ".".join(["{0}{1}".format(row.name, row.version) for row in versions] + [_templates_hash()])
+            last_modified = max(row.updated_at for row in versions).replace(tzinfo=timezone.utc, microsecond=0)
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = current_app.response_class(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            # "no-cache" lets the browser keep the page, but makes it check with us before showing it again
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,72 @@
+# Shared fixtures for the tests. Run them from the top folder with "python -m pytest".
+# The migrations build one SQLite database per test run, so it has exactly the tables, indexes and search objects
+# of production, and every test then gets its own copy of that file, which it can change as much as it likes.
+import shutil
+import pytest
+from flask_migrate import upgrade
+from taskmanager import create_app, db
+from taskmanager.caching import invalidate_categories
+from taskmanager.database import engine_options
+
+
+def make_config(path):
+    url = "sqlite:///" + str(path)
+    return {
+        "TESTING": True,
+        "SQLALCHEMY_RECORD_QUERIES": False,
+        "SECRET_KEY": "test",
+        "SQLALCHEMY_DATABASE_URI": url,
+        "SQLALCHEMY_ENGINE_OPTIONS": engine_options(url),
+        "SQLALCHEMY_BINDS": {},
+        "INSTRUMENTATION": False,
+        "JINJA_BYTECODE_CACHE": "",
+        # every category is deleted straight away, rather than by a background thread the test would have to wait for
+        "CATEGORY_DELETE_BACKGROUND_THRESHOLD": 0,
+    }
+
+
+@pytest.fixture(scope="session")
+def migrated_database(tmp_path_factory):
+    path = tmp_path_factory.mktemp("migrated") / "taskmanager.db"
+    app = create_app(make_config(path))
+    with app.app_context():
+        upgrade()
+    return path
+
+
+@pytest.fixture
+def app(migrated_database, tmp_path):
+    path = tmp_path / "taskmanager.db"
+    shutil.copyfile(migrated_database, path)
+    app = create_app(make_config(path))
+    # the category cache lives in the module, so it would otherwise still hold the last test's categories
+    invalidate_categories()
+    with app.app_context():
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def categories(client):
+    """Two categories, "Home" and "Work", as {name: id}."""
+    response = client.post("/api/v1/categories", json=[{"category_name": "Home"}, {"category_name": "Work"}])
+    assert response.status_code == 201
+    return {"Home": response.json["results"][0]["id"], "Work": response.json["results"][1]["id"]}
+
+
+def task_item(name, category, **fields):
+    """A valid task for the JSON API, with any field replaced by 'fields'."""
+    item = {
+        "task_name": name,
+        "task_description": "Something to do",
+        "due_date": "2030-01-01",
+        "category_name": category,
+        "is_urgent": False,
+    }
+    item.update(fields)
+    return item
@@ -0,0 +1,140 @@
+# The batch endpoints of the JSON API (api.py and bulk.py): every item gets its own result,
+# and an item that fails doesn't stop the rest of its batch.
+from conftest import task_item
+from taskmanager.models import Category, Task
+
+
+def statuses(response):
+    return [result["status"] for result in response.json["results"]]
+
+
+def errors(response):
+    return {result["index"]: result["error"] for result in response.json["results"] if result["status"] == "error"}
+
+
+def create_tasks(client, *names, category="Home"):
+    response = client.post("/api/v1/tasks", json=[task_item(name, category) for name in names])
+    assert response.status_code == 201
+    return [result["id"] for result in response.json["results"]]
+
+
+def test_create_tasks_reports_each_item(client, categories):
+    create_tasks(client, "Existing")
+    response = client.post("/api/v1/tasks", json=[
+        task_item("New", "Home"),
+        task_item("No date", "Home", due_date="next week"),
+        task_item("Nowhere", "Garden"),
+        task_item("Existing", "Home"),
+        task_item("Twice", "Work"),
+        task_item("Twice", "Work"),
+        "not an object",
+    ])
+    assert response.status_code == 201
+    assert statuses(response) == ["created", "error", "error", "error", "created", "error", "error"]
+    assert response.json["errors"] == 5
+    assert errors(response) == {
+        1: "'due_date' must be a date in the format YYYY-MM-DD",
+        2: "category name 'Garden' does not exist",
+        3: "task_name 'Existing' already exists",
+        5: "task_name 'Twice' appears more than once in this batch",
+        6: "each task must be a JSON object",
+    }
+    assert Task.query.count() == 3
+
+
+def test_create_tasks_on_duplicate(client, categories):
+    [existing] = create_tasks(client, "Existing")
+    skipped = client.post("/api/v1/tasks?on_duplicate=skip", json=[task_item("Existing", "Work")])
+    assert skipped.json["results"] == [{"index": 0, "status": "skipped", "id": existing}]
+    assert Task.query.get(existing).category_id == categories["Home"]
+
+    updated = client.post("/api/v1/tasks?on_duplicate=update", json=[task_item("Existing", "Work")])
+    assert updated.json["results"] == [{"index": 0, "status": "updated", "id": existing}]
+    assert Task.query.get(existing).category_id == categories["Work"]
+
+
+def test_update_tasks_reports_each_item(client, categories):
+    first, second = create_tasks(client, "First", "Second")
+    response = client.patch("/api/v1/tasks", json=[
+        {"id": first, "is_urgent": True},
+        {"task_name": "Second", "category_name": "Work"},
+        {"id": 999999, "is_urgent": True},
+        {"id": first},
+        {"id": second, "due_date": "soon"},
+    ])
+    assert response.status_code == 200
+    assert statuses(response) == ["updated", "updated", "error", "error", "error"]
+    assert errors(response) == {
+        2: "task id '999999' does not exist",
+        3: "there is nothing to update",
+        4: "'due_date' must be a date in the format YYYY-MM-DD",
+    }
+    assert Task.query.get(first).is_urgent is True
+    assert Task.query.get(second).category_id == categories["Work"]
+
+
+def test_update_tasks_fails_only_the_clashing_renames(client, categories):
+    first, second, third = create_tasks(client, "First", "Second", "Third")
+    response = client.patch("/api/v1/tasks", json=[
+        {"id": first, "task_name": "Second"},
+        {"id": second, "task_name": "Second", "task_description": "Same name as before"},
+        {"id": third, "task_name": "Renamed"},
+    ])
+    assert response.status_code == 200
+    assert statuses(response) == ["error", "updated", "updated"]
+    assert errors(response) == {0: "task_name 'Second' already exists"}
+
+    response = client.patch("/api/v1/tasks", json=[
+        {"id": first, "task_name": "Taken twice"},
+        {"id": second, "task_name": "Taken twice"},
+    ])
+    assert statuses(response) == ["updated", "error"]
+    assert errors(response) == {1: "task_name 'Taken twice' appears more than once in this batch"}
+    names = [name for name, in Task.query.with_entities(Task.task_name).order_by(Task.id)]
+    assert names == ["Taken twice", "Second", "Renamed"]
+
+
+def test_delete_tasks_reports_each_item(client, categories):
+    first, second, third = create_tasks(client, "First", "Second", "Third")
+    response = client.delete("/api/v1/tasks", json=[first, "Second", 999999, "Missing", {}])
+    assert response.status_code == 200
+    assert statuses(response) == ["deleted", "deleted", "error", "error", "error"]
+    assert errors(response) == {
+        2: "task id '999999' does not exist",
+        3: "task name 'Missing' does not exist",
+        4: "either 'id' or 'task_name' is required to find an existing row",
+    }
+    assert [task.id for task in Task.query] == [third]
+
+
+def test_categories_report_each_item(client, categories):
+    created = client.post("/api/v1/categories", json=[
+        {"category_name": "Garden"}, {"category_name": "Home"}, {"category_name": "x" * 26},
+    ])
+    assert statuses(created) == ["created", "error", "error"]
+    assert errors(created) == {
+        1: "category_name 'Home' already exists",
+        2: "'category_name' must be at most 25 characters",
+    }
+    garden = created.json["results"][0]["id"]
+
+    renamed = client.patch("/api/v1/categories", json=[
+        {"id": categories["Home"], "category_name": "Work"},
+        {"id": categories["Work"], "category_name": "Office"},
+        {"id": garden, "category_name": "Office"},
+        {"category_name": "Garden"},
+    ])
+    assert renamed.status_code == 200
+    assert statuses(renamed) == ["error", "updated", "error", "error"]
+    assert errors(renamed) == {
+        0: "category_name 'Work' already exists",
+        2: "category_name 'Office' appears more than once in this batch",
+        3: "'id' is required to rename a category",
+    }
+
+    create_tasks(client, "In the garden", category="Garden")
+    deleted = client.delete("/api/v1/categories", json=["Garden", 999999])
+    assert statuses(deleted) == ["deleted", "error"]
+    assert sorted(category.category_name for category in Category.query) == ["Home", "Office"]
+    # the garden's task went with it
+    assert Task.query.count() == 0
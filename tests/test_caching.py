@@ -0,0 +1,35 @@
+# The category cache (caching.py): it's dropped whenever a category changes, and a list that was being read
+# while that happened is never stored.
+from taskmanager import caching, db
+
+
+def cached_categories():
+    return caching._cache.get("categories") if caching._cache is not None else None
+
+
+def test_categories_are_cached_until_they_change(client, categories):
+    assert [name for _, name in caching.get_categories()] == ["Home", "Work"]
+    assert cached_categories() is not None
+    client.post("/api/v1/categories", json=[{"category_name": "Garden"}])
+    assert cached_categories() is None
+    assert [name for _, name in caching.get_categories()] == ["Garden", "Home", "Work"]
+
+
+def test_an_invalidation_during_a_miss_isnt_overwritten(categories):
+    caching.invalidate_categories()
+    invalidations = []
+
+    def invalidate_once(conn, cursor, statement, parameters, context, executemany):
+        # another thread commits a category change right after our SELECT has gone to the database
+        if not invalidations:
+            invalidations.append(statement)
+            caching.invalidate_categories()
+    db.event.listen(db.engine, "before_cursor_execute", invalidate_once)
+    try:
+        assert [name for _, name in caching.get_categories()] == ["Home", "Work"]
+    finally:
+        db.event.remove(db.engine, "before_cursor_execute", invalidate_once)
+    # the list may be out of date, so it's returned this once but not kept
+    assert cached_categories() is None
+    caching.get_categories()
+    assert cached_categories() is not None
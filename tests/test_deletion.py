@@ -0,0 +1,39 @@
+# Deleting large categories in the background (deletion.py), and picking the delete up again after
+# the worker that was running it has stopped.
+import time
+import pytest
+from conftest import task_item
+from taskmanager import deletion, stats
+from taskmanager.models import Category, Task
+
+
+class Interrupted(Exception):
+    pass
+
+
+def wait_for_background_deletes(timeout=10):
+    started = time.monotonic()
+    while deletion._running and time.monotonic() - started < timeout:
+        time.sleep(0.01)
+    assert not deletion._running
+
+
+def test_progress_page_restarts_an_interrupted_delete(client, categories):
+    work = categories["Work"]
+    client.post("/api/v1/tasks", json=[task_item("Task {0}".format(number), "Work") for number in range(10)])
+
+    def stop(deleted):
+        raise Interrupted()
+    # as if the worker running the delete was recycled after its first batch
+    with pytest.raises(Interrupted):
+        deletion.delete_category_in_batches(work, batch_size=4, on_batch=stop)
+    assert deletion.remaining_tasks(work) == 6
+
+    response = client.get("/delete_category/{0}/progress".format(work))
+    assert response.status_code == 200
+    wait_for_background_deletes()
+    assert Category.query.get(work) is None
+    assert Task.query.count() == 0
+    assert stats.drift() == []
+    # once it's gone, the progress page sends people back to the categories
+    assert client.get("/delete_category/{0}/progress".format(work)).status_code == 302
@@ -0,0 +1,88 @@
+# Chunked imports (importer.py): every chunk is committed on its own, and an interrupted import
+# carries on from the last committed row, through importer.import_tasks(), the API and "flask import-tasks".
+import io
+import json
+import pytest
+from taskmanager import importer
+from taskmanager.models import Task
+
+CSV = (
+    "task_name,task_description,due_date,category_name,is_urgent\n"
+    "One,First task,2030-01-01,Home,true\n"
+    "Two,Second task,2030-01-02,Home,false\n"
+    "Three,Third task,not a date,Home,false\n"
+    "Four,Fourth task,2030-01-04,Work,yes\n"
+    "Five,Fifth task,2030-01-05,Work,\n"
+)
+
+
+class Interrupted(Exception):
+    pass
+
+
+def task_names():
+    return [name for name, in Task.query.with_entities(Task.task_name).order_by(Task.task_name)]
+
+
+def test_import_counts_rows_and_reports_errors(categories):
+    progress = importer.import_tasks(io.StringIO(CSV), "csv", chunk_size=2)
+    assert progress.rows == 5
+    assert progress.counts == {"created": 4, "updated": 0, "skipped": 0, "error": 1}
+    assert progress.errors == [(3, "'due_date' must be a date in the format YYYY-MM-DD")]
+    assert Task.query.filter_by(task_name="Four").one().is_urgent is True
+
+
+def test_import_resumes_from_start_row(categories):
+    committed = []
+
+    def stop_after_first_chunk(progress):
+        committed.append(progress.rows)
+        raise Interrupted()
+
+    with pytest.raises(Interrupted):
+        importer.import_tasks(io.StringIO(CSV), "csv", chunk_size=2, on_chunk=stop_after_first_chunk)
+    assert committed == [2]
+    assert task_names() == ["One", "Two"]
+
+    # on_duplicate="error" would fail any row that was sent a second time
+    progress = importer.import_tasks(io.StringIO(CSV), "csv", chunk_size=2, on_duplicate="error", start_row=2)
+    assert progress.rows == 5
+    assert progress.counts == {"created": 2, "updated": 0, "skipped": 0, "error": 1}
+    assert progress.errors == [(3, "'due_date' must be a date in the format YYYY-MM-DD")]
+    assert task_names() == ["Five", "Four", "One", "Two"]
+
+
+def test_api_import_resumes_from_start_row(client, categories):
+    lines = [json.dumps({
+        "task_name": "Task {0}".format(number), "task_description": "Imported",
+        "due_date": "2030-01-01", "category_name": "Home",
+    }) for number in range(5)]
+    body = "\n".join(lines).encode("utf-8")
+    response = client.post(
+        "/api/v1/tasks/import?start_row=3&on_duplicate=error",
+        data={"file": (io.BytesIO(body), "tasks.ndjson")}
+    )
+    assert response.status_code == 200
+    assert response.json["rows"] == 5
+    assert response.json["created"] == 2
+    assert task_names() == ["Task 3", "Task 4"]
+
+
+def test_cli_import_resumes_from_its_state_file(app, categories, tmp_path):
+    source = tmp_path / "tasks.csv"
+    source.write_text(CSV)
+    (tmp_path / "tasks.csv.import-state").write_text(json.dumps({"rows": 3}))
+    result = app.test_cli_runner().invoke(args=["import-tasks", str(source), "--on-duplicate", "error"])
+    assert result.exit_code == 0, result.output
+    assert "Resuming after row 3." in result.output
+    assert task_names() == ["Five", "Four"]
+    # a finished import removes its state file, so the next one starts from the top
+    assert not (tmp_path / "tasks.csv.import-state").exists()
+
+
+def test_api_import_turns_away_large_files(app, client, categories):
+    app.config["API_IMPORT_MAX_BYTES"] = 100
+    response = client.post("/api/v1/tasks/import", data={"file": (io.BytesIO(CSV.encode("utf-8")), "tasks.csv")})
+    assert response.status_code == 413
+    assert "flask import-tasks" in response.json["error"]
+    assert task_names() == []
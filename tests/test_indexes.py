@@ -0,0 +1,16 @@
+# "flask check-indexes" (cli.py), against the database the migrations build: every hot query has to use its index.
+from taskmanager import db
+
+
+def test_check_indexes_passes_on_the_migrated_database(app):
+    result = app.test_cli_runner().invoke(args=["check-indexes"])
+    assert result.exit_code == 0, result.output
+    assert "MISSING" not in result.output
+
+
+def test_check_indexes_fails_without_an_index(app):
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql("DROP INDEX ix_task_due_date_id")
+    result = app.test_cli_runner().invoke(args=["check-indexes"])
+    assert result.exit_code != 0
+    assert "MISSING home page" in result.output
@@ -0,0 +1,29 @@
+# The /metrics page (instrumentation.py): under gunicorn every worker process keeps its own numbers, so the page has
+# to add up what all of them have counted, whichever worker answers it.
+import os
+import subprocess
+import sys
+from conftest import make_config
+from taskmanager import create_app
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COUNT_QUERIES = (
+    "import sys; from taskmanager import instrumentation; instrumentation.DB_QUERIES.labels('/').inc(int(sys.argv[1]))"
+)
+
+
+def test_metrics_add_up_every_worker(tmp_path, monkeypatch):
+    folder = tmp_path / "metrics"
+    folder.mkdir()
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(folder), PYTHONPATH=ROOT)
+    # two workers, each one counting its own queries and then stopping, as gunicorn's workers do when recycled
+    for queries in (3, 4):
+        subprocess.run([sys.executable, "-c", COUNT_QUERIES, str(queries)], env=env, cwd=ROOT, check=True)
+
+    monkeypatch.setenv("PROMETHEUS_MULTIPROC_DIR", str(folder))
+    app = create_app(dict(make_config(tmp_path / "taskmanager.db"), INSTRUMENTATION=True))
+    response = app.test_client().get("/metrics")
+    assert response.status_code == 200
+    assert 'taskmanager_db_queries_total{route="/"} 7.0' in response.text
+    # one series for both workers, rather than one per process id
+    assert "pid" not in response.text and "worker" not in response.text
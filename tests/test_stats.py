@@ -0,0 +1,168 @@
+# The task stats behind the dashboard (stats.py) are kept up to date by every write, instead of being counted
+# each time, so after every way of changing tasks and categories the stored totals must match a fresh count.
+import io
+import threading
+import time
+from datetime import date
+from sqlalchemy import event
+from conftest import task_item
+from taskmanager import db, deletion, importer, stats
+from taskmanager.database import lock_for_update
+from taskmanager.models import Task, TaskStats
+
+
+def stored():
+    return {row.category_id: (row.task_count, row.urgent_count) for row in TaskStats.query}
+
+
+def form(name, category_id, urgent=False, due_date="05 September, 2030"):
+    data = {
+        "task_name": name, "task_description": "From the form", "due_date": due_date, "category_id": str(category_id)
+    }
+    if urgent:
+        data["is_urgent"] = "on"
+    return data
+
+
+def task_id(name):
+    return Task.query.filter_by(task_name=name).one().id
+
+
+def test_form_routes(client):
+    client.post("/add_category", data={"category_name": "Home"})
+    client.post("/add_category", data={"category_name": "Work"})
+    home, work = sorted(stored())
+    assert stored() == {home: (0, 0), work: (0, 0)}
+
+    client.post("/add_task", data=form("Urgent", home, urgent=True))
+    client.post("/add_task", data=form("Later", home))
+    assert stored() == {home: (2, 1), work: (0, 0)}
+    assert stats.drift() == []
+
+    client.post("/edit_task/{0}".format(task_id("Urgent")), data=form("Urgent", work))
+    assert stored() == {home: (1, 0), work: (1, 0)}
+    client.post("/edit_task/{0}".format(task_id("Later")), data=form("Later", home, urgent=True))
+    client.post("/edit_category/{0}".format(home), data={"category_name": "House"})
+    assert stats.drift() == []
+
+    client.get("/delete_task/{0}".format(task_id("Later")))
+    assert stored() == {home: (0, 0), work: (1, 0)}
+    client.get("/delete_category/{0}".format(work))
+    assert stored() == {home: (0, 0)}
+    assert stats.drift() == []
+
+
+def test_overlapping_edits_count_once(client, categories):
+    home = categories["Home"]
+    client.post("/api/v1/tasks", json=[task_item("Shared", "Home")])
+    # this test's own edit holds the task while a form edit makes the very same change
+    task = lock_for_update(Task.query.filter_by(task_name="Shared")).one()
+    responses = []
+    other_edit = threading.Thread(target=lambda: responses.append(
+        client.post("/edit_task/{0}".format(task.id), data=form("Shared", home, urgent=True))
+    ))
+    other_edit.start()
+    time.sleep(0.3)
+    task.is_urgent = True
+    db.session.commit()
+    other_edit.join()
+    assert responses[0].status_code == 200
+    # the form edit waited, and then found the task already urgent, so the task counts as urgent only once
+    assert stored()[home] == (1, 1)
+    assert stats.drift() == []
+
+
+def test_batch_api(client, categories):
+    home, work = categories["Home"], categories["Work"]
+    assert stored() == {home: (0, 0), work: (0, 0)}
+    client.post("/api/v1/tasks", json=[
+        task_item("One", "Home", is_urgent=True), task_item("Two", "Home"), task_item("Three", "Work"),
+    ])
+    assert stored() == {home: (2, 1), work: (1, 0)}
+
+    client.patch("/api/v1/tasks", json=[
+        {"task_name": "One", "category_id": work}, {"task_name": "Two", "is_urgent": True},
+        {"task_name": "Three", "task_description": "Doesn't change the totals"},
+    ])
+    assert stored() == {home: (1, 1), work: (2, 1)}
+    client.post("/api/v1/tasks?on_duplicate=update", json=[task_item("Three", "Home", is_urgent=True)])
+    assert stored() == {home: (2, 2), work: (1, 1)}
+    assert stats.drift() == []
+
+    client.delete("/api/v1/tasks", json=["Two"])
+    assert stored() == {home: (1, 1), work: (1, 1)}
+    client.delete("/api/v1/categories", json=[work])
+    assert stored() == {home: (1, 1)}
+    assert stats.drift() == []
+
+
+def test_batch_updates_the_stats_in_one_statement(client):
+    names = ["Category {0}".format(number) for number in range(6)]
+    client.post("/api/v1/categories", json=[{"category_name": name} for name in names])
+    # rows that went missing somehow are put back, in the same single INSERT ... SELECT
+    db.session.execute(TaskStats.__table__.delete())
+    db.session.commit()
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement.split()[:3])
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        client.post("/api/v1/tasks", json=[task_item("Task in " + name, name) for name in names])
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    assert statements.count(["UPDATE", "task_stats", "SET"]) == 1
+    assert statements.count(["INSERT", "INTO", "task_stats"]) == 1
+    assert sorted(stored().values()) == [(1, 0)] * 6
+    assert stats.drift() == []
+
+
+def test_import(categories):
+    lines = ["task_name,task_description,due_date,category_name,is_urgent"] + [
+        "Task {0},Imported,2030-01-01,{1},{2}".format(number, "Home" if number % 2 else "Work", number % 3 == 0)
+        for number in range(10)
+    ]
+    importer.import_tasks(io.StringIO("\n".join(lines) + "\n"), "csv", chunk_size=3)
+    # urgent are tasks 0, 3, 6 and 9: two in each category
+    assert stored() == {categories["Home"]: (5, 2), categories["Work"]: (5, 2)}
+    assert stats.drift() == []
+
+
+def test_batched_category_delete(client, categories):
+    client.post("/api/v1/tasks", json=[
+        task_item("Task {0}".format(number), "Work", is_urgent=number < 3) for number in range(10)
+    ] + [task_item("Stays", "Home")])
+    deleted = deletion.delete_category_in_batches(categories["Work"], batch_size=4)
+    assert deleted == 10
+    assert stored() == {categories["Home"]: (1, 0)}
+    assert stats.drift() == []
+
+
+def test_summary_splits_overdue_and_this_week(client, categories):
+    # a Wednesday, so the week runs up to Sunday the 15th
+    today = date(2030, 9, 11)
+    client.post("/api/v1/tasks", json=[
+        task_item("Overdue", "Home", due_date="2030-09-10", is_urgent=True),
+        task_item("Today", "Home", due_date="2030-09-11"),
+        task_item("Sunday", "Work", due_date="2030-09-15"),
+        task_item("Next week", "Work", due_date="2030-09-16"),
+    ])
+    summary = stats.summary(today)
+    assert [category["category_name"] for category in summary["categories"]] == ["Home", "Work"]
+    home, work = summary["categories"]
+    assert (home["tasks"], home["urgent"], home["overdue"], home["due_this_week"]) == (2, 1, 1, 1)
+    assert (work["tasks"], work["urgent"], work["overdue"], work["due_this_week"]) == (2, 0, 0, 1)
+    assert summary["totals"] == {"tasks": 4, "urgent": 1, "overdue": 1, "due_this_week": 2}
+
+
+def test_rebuild_fixes_drift(client, categories):
+    client.post("/api/v1/tasks", json=[task_item("One", "Home", is_urgent=True)])
+    db.session.execute(TaskStats.__table__.update().values(task_count=7))
+    db.session.commit()
+    assert stats.drift() == [
+        (categories["Home"], (7, 1), (1, 1)),
+        (categories["Work"], (7, 0), (0, 0)),
+    ]
+    stats.rebuild()
+    db.session.commit()
+    assert stats.drift() == []
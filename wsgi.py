@@ -0,0 +1,13 @@
+# The entry point for a production WSGI server. The Procfile starts gunicorn with it, like this:
+#   gunicorn wsgi:app
+# and gunicorn reads its settings (workers, threads, port and so on) from gunicorn.conf.py, next to this file.
+from taskmanager import create_app, templating
+
+app = create_app(commands=False)
+# the web server never runs any "flask ..." commands, so it doesn't need Flask-Migrate (and Alembic) at all
+
+templating.precompile(app)
+# Every template is loaded now, while the worker boots, rather than during its first requests.
+# With preload_app (see gunicorn.conf.py) this happens once, in gunicorn's main process, and every worker
+# it forks starts with all of the templates already compiled. They come out of the bytecode cache that
+# "flask precompile-templates" filled during the build, so even this only takes a few milliseconds.